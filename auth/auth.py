@@ -1,13 +1,46 @@
+from typing import Optional
+
+import jwt
+from fastapi_users import models
 from fastapi_users.authentication import CookieTransport, AuthenticationBackend
 from fastapi_users.authentication import JWTStrategy
+from fastapi_users.jwt import decode_jwt
+from fastapi_users.manager import BaseUserManager
+
+from cache import user_cache, MISSING
 
 
 cookie_transport = CookieTransport(cookie_name="auth", cookie_max_age=3600, cookie_secure=False)
 
 SECRET = "SECRET"
 
+
+class CachedJWTStrategy(JWTStrategy):
+    """Verifies the token on every call but loads the user row at most once per USER_CACHE_TTL."""
+
+    async def read_token(self, token: Optional[str],
+                         user_manager: BaseUserManager[models.UP, models.ID]) -> Optional[models.UP]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = data["sub"]
+        except (jwt.PyJWTError, KeyError):
+            return None
+
+        user = user_cache.get(user_id)
+        if user is not MISSING:
+            return user
+
+        user = await super().read_token(token, user_manager)
+        if user is not None:
+            user_cache.set(user_id, user)
+        return user
+
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
 auth_backend = AuthenticationBackend(
     name="jwt",
@@ -1,9 +1,11 @@
 import uuid
-from typing import Optional
+from typing import Any, Dict, Optional
 from fastapi import Depends, Request
 from fastapi.openapi.models import Response
 from fastapi_users import BaseUserManager, UUIDIDMixin, IntegerIDMixin
+from cache import invalidate_user
 from database import User, get_user_db
+from redis_client import get_redis, REDIS_CACHE_DB
 
 SECRET = "SECRET"
 
@@ -24,6 +26,20 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     ):
         print(f"User {user.id} logged in.")
 
+    async def on_after_update(
+            self,
+            user: User,
+            update_dict: Dict[str, Any],
+            request: Optional[Request] = None,
+    ):
+        await invalidate_user(get_redis(REDIS_CACHE_DB), user.id)
+
+    async def on_after_verify(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(get_redis(REDIS_CACHE_DB), user.id)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(get_redis(REDIS_CACHE_DB), user.id)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
@@ -0,0 +1,232 @@
+"""In-process load test for the API hot paths.
+
+Boots main:app through httpx's ASGI transport against fakeredis and SQLite
+(or a scratch Postgres given with --database-url) and writes throughput and
+p50/p95/p99 latency per endpoint to a JSON file. The batch scenario also
+reports links/s and how far ahead of /links/shorten it is:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load --requests 2000 --concurrency 32 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="async SQLAlchemy URL, SQLite in a temp dir by default")
+    parser.add_argument("--sync-database-url", help="sync URL of the same database")
+    parser.add_argument("--links", type=int, default=1000, help="links seeded before the run")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1000, help="links per /links/shorten/batch request")
+    parser.add_argument("--batch-requests", type=int, default=20, help="requests for the batch scenario")
+    parser.add_argument("--cleanup-runs", type=int, default=5)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args()
+
+
+def configure(args):
+    # config.py reads the environment on import, so this has to run first
+    if not args.database_url:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        args.database_url = f"sqlite+aiosqlite:///{path}"
+        args.sync_database_url = f"sqlite:///{path}"
+        os.environ.setdefault("CODE_ALLOCATOR", "random")
+
+    # the limiter would turn most of the measured requests into 429s
+    os.environ["RATE_LIMITS"] = ""
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["SYNC_DATABASE_URL"] = args.sync_database_url or args.database_url.replace("+asyncpg", "")
+
+
+def summarize(timings: list, errors: int, elapsed: float) -> dict:
+    timings = sorted(timings)
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        "requests": len(timings) + errors,
+        "errors": errors,
+        "rps": round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p95_ms": round(quantiles[94] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+    }
+
+
+async def drive(make_request, total: int, concurrency: int, expected: set) -> dict:
+    timings = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for number in counter:
+            start = time.perf_counter()
+            response = await make_request(number)
+            elapsed = time.perf_counter() - start
+            if response.status_code in expected:
+                timings.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(timings, errors, time.perf_counter() - started)
+
+
+async def seed(count: int, user_id: int, expired: bool = False, prefix: str = None) -> list:
+    from bloom import link_filter
+    from database import async_session_maker, Link, LinkCode
+    from shorten.urls import url_digest
+
+    now = datetime.now()
+    links = []
+    async with async_session_maker() as session:
+        for number in range(count):
+            # expired codes keep their link_codes rows until archived, every seeding needs fresh ones
+            code = f"{prefix or ('exp' if expired else 'bench')}{number}.ru"
+            long_url = f"https://example.com/{'expired' if expired else 'page'}/{number}"
+            link = Link(user_id=user_id,
+                        long_url=long_url,
+                        long_url_hash=url_digest(long_url),
+                        short_url=code,
+                        views=0,
+                        expires_at=now - timedelta(minutes=1) if expired else None)
+            link.codes = [LinkCode(code=code)]
+            session.add(link)
+            links.append((code, long_url))
+        await session.commit()
+
+    # the app adds new codes to the missing-code filter when it creates them, seeding has to as well
+    link_filter.add(*(code for code, _ in links))
+    return links
+
+
+async def run(args) -> dict:
+    import fakeredis
+    import httpx
+    from fakeredis import aioredis as fake_aioredis
+
+    import redis_client
+    from database import Base, get_async_engine
+
+    server = fakeredis.FakeServer()
+    for db in (redis_client.REDIS_CACHE_DB, redis_client.REDIS_CELERY_DB):
+        redis_client.register_redis(db,
+                                    fake_aioredis.FakeRedis(server=server, db=db),
+                                    fakeredis.FakeRedis(server=server, db=db))
+
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    from main import app
+    from later.maintenance import cleanup_expired
+
+    await app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            email = "bench@example.com"
+            await client.post("/auth/register", json={
+                "id": 1, "email": email, "username": "bench", "password": "bench",
+                "registered_at": datetime.now().isoformat(),
+            })
+            login = await client.post("/auth/jwt/login", data={"username": email, "password": "bench"})
+            login.raise_for_status()
+
+            links = await seed(args.links, user_id=1)
+
+            def pick():
+                return random.choice(links)
+
+            results["redirect"] = await drive(
+                lambda _: client.get(f"/links/{pick()[0]}"), args.requests, args.concurrency, {301, 302, 307})
+            results["shorten"] = await drive(
+                lambda number: client.post("/links/shorten", json={"long_url": f"https://example.org/{number}"}),
+                args.requests, args.concurrency, {200})
+
+            def batch(number):
+                first = number * args.batch_size
+                body = "".join(json.dumps({"long_url": f"https://example.net/{first + offset}"}) + "\n"
+                               for offset in range(args.batch_size))
+                return client.post("/links/shorten/batch", content=body,
+                                   headers={"content-type": "application/x-ndjson"})
+
+            results["shorten_batch"] = await drive(batch, args.batch_requests, args.concurrency, {200})
+            # links created per second against the single endpoint, the batch is meant to be 50x or more ahead
+            links_per_second = results["shorten_batch"]["rps"] * args.batch_size
+            results["shorten_batch"]["links_per_second"] = round(links_per_second, 1)
+            results["shorten_batch"]["vs_shorten"] = (round(links_per_second / results["shorten"]["rps"], 1)
+                                                      if results["shorten"]["rps"] else None)
+
+            results["stats"] = await drive(
+                lambda _: client.get(f"/links/{pick()[0]}/stats"), args.requests, args.concurrency, {200})
+            results["search"] = await drive(
+                lambda _: client.get("/links/search/", params={"original_url": pick()[1]}),
+                args.requests, args.concurrency, {200})
+
+        cleanup_timings = []
+        cleanup_rows = 0
+        for run_number in range(args.cleanup_runs):
+            await seed(args.links, user_id=1, expired=True, prefix=f"exp{run_number}-")
+            start = time.perf_counter()
+            # the same job the Celery task runs
+            cleanup_rows += await cleanup_expired()
+            cleanup_timings.append(time.perf_counter() - start)
+
+        results["cleanup"] = summarize(cleanup_timings, 0, sum(cleanup_timings))
+        results["cleanup"]["rows_per_second"] = round(cleanup_rows / sum(cleanup_timings), 1)
+
+    finally:
+        await app.router.shutdown()
+
+    return results
+
+
+def revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    args = parse_args()
+    configure(args)
+
+    results = asyncio.run(run(args))
+    report = {
+        "revision": revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": args.database_url.split("://")[0],
+        "links": args.links,
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size,
+        "endpoints": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for endpoint, numbers in results.items():
+        print(f"{endpoint:>13}: {numbers['rps']:>9} req/s  p50 {numbers['p50_ms']} ms  "
+              f"p95 {numbers['p95_ms']} ms  p99 {numbers['p99_ms']} ms  errors {numbers['errors']}")
+
+    batch = results["shorten_batch"]
+    print(f"{'':>13}  {batch['links_per_second']} links/s in batches of {args.batch_size}, "
+          f"{batch['vs_shorten']}x /links/shorten")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Redirect lookup latency: short_url OR custom_alias scan vs link_codes point lookup.
+
+Builds throwaway tables next to the real schema, so point it at a scratch database:
+
+    python -m benchmarks.lookup_bench 1000000 10000000
+"""
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+
+from config import DB_URL
+
+
+LOOKUPS = 200
+
+
+def fill(conn, rows: int):
+    conn.execute(text("DROP TABLE IF EXISTS bench_link_codes, bench_links"))
+    conn.execute(text("""
+        CREATE TABLE bench_links (
+            id integer PRIMARY KEY,
+            long_url varchar NOT NULL,
+            short_url varchar,
+            custom_alias varchar UNIQUE
+        )
+    """))
+    conn.execute(text("""
+        INSERT INTO bench_links (id, long_url, short_url, custom_alias)
+        SELECT i,
+               'https://example.com/' || md5(i::text),
+               substr(md5('s' || i::text), 1, 12) || '.ru',
+               CASE WHEN i % 10 = 0 THEN 'alias' || i END
+        FROM generate_series(1, :rows) AS i
+    """), {"rows": rows})
+    conn.execute(text("""
+        CREATE TABLE bench_link_codes (
+            code varchar PRIMARY KEY,
+            link_id integer NOT NULL REFERENCES bench_links (id)
+        )
+    """))
+    conn.execute(text("""
+        INSERT INTO bench_link_codes (code, link_id)
+        SELECT short_url, id FROM bench_links
+        UNION ALL
+        SELECT custom_alias, id FROM bench_links WHERE custom_alias IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """))
+    conn.execute(text("ANALYZE bench_links"))
+    conn.execute(text("ANALYZE bench_link_codes"))
+
+
+def measure(conn, query: str, codes: list) -> dict:
+    timings = []
+    for code in codes:
+        start = time.perf_counter()
+        conn.execute(text(query), {"code": code}).first()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 3),
+    }
+
+
+def main(sizes: list):
+    engine = create_engine(DB_URL)
+
+    for rows in sizes:
+        with engine.begin() as conn:
+            fill(conn, rows)
+
+        with engine.connect() as conn:
+            codes = [conn.scalar(text("SELECT short_url FROM bench_links WHERE id = :id"),
+                                 {"id": random.randint(1, rows)}) for _ in range(LOOKUPS)]
+
+            before = measure(conn, """
+                SELECT * FROM bench_links
+                WHERE short_url = :code OR custom_alias = :code
+            """, codes)
+            after = measure(conn, """
+                SELECT bench_links.* FROM bench_links
+                JOIN bench_link_codes ON bench_link_codes.link_id = bench_links.id
+                WHERE bench_link_codes.code = :code
+            """, codes)
+
+        print(f"{rows} rows: before {before}, after {after}")
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_link_codes, bench_links"))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000_000, 10_000_000])
@@ -0,0 +1,40 @@
+"""Per-request cost of the rate limiter against the Redis at REDIS_URL.
+
+    python -m benchmarks.ratelimit_bench 20000
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from fastapi import HTTPException
+
+from ratelimit import RateLimiter
+
+
+async def measure(limiter: RateLimiter, checks: int) -> dict:
+    timings = []
+    for number in range(checks):
+        start = time.perf_counter()
+        try:
+            await limiter.check("bench", f"client{number % 100}")
+        except HTTPException:
+            pass
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        "mean_us": round(statistics.mean(timings) * 1e6, 2),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 2),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 2),
+    }
+
+
+async def main(checks: int):
+    limits = {"bench": (1000.0, 1000)}
+    print("redis round trip per check:", await measure(RateLimiter(limits, local_share=0), checks))
+    print("local lease pre-check:     ", await measure(RateLimiter(limits, local_share=0.1), checks))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
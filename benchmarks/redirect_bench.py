@@ -0,0 +1,121 @@
+"""Cached redirect throughput with and without the raw ASGI fast path.
+
+Each mode runs in a fresh interpreter with REDIRECT_FAST_PATH set, against
+fakeredis and SQLite. Links are requested a few times first so every
+measured request is a cache hit, then requests per CPU second of the single
+event loop thread are reported as requests per second per core:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.redirect_bench --requests 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--min-speedup", type=float, default=1.0,
+                        help="fail unless the fast path serves this many times more requests per core")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+async def measure(args) -> dict:
+    import fakeredis
+    import httpx
+    from fakeredis import aioredis as fake_aioredis
+
+    import redis_client
+    from benchmarks.load import seed
+    from database import Base, get_async_engine
+
+    server = fakeredis.FakeServer()
+    for db in (redis_client.REDIS_CACHE_DB, redis_client.REDIS_CELERY_DB):
+        redis_client.register_redis(db, fake_aioredis.FakeRedis(server=server, db=db))
+
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    from main import app
+
+    links = await seed(args.links, user_id=1)
+    codes = [code for code, _ in links]
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # the first request of a code goes to the database, the rest are cache hits
+            for code in codes:
+                for _ in range(3):
+                    await client.get(f"/links/{code}")
+
+            counter = iter(range(args.requests))
+            errors = 0
+
+            async def worker():
+                nonlocal errors
+                for _ in counter:
+                    response = await client.get(f"/links/{random.choice(codes)}")
+                    if response.status_code != 307:
+                        errors += 1
+
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            cpu = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+    finally:
+        await app.router.shutdown()
+
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "rps": round(args.requests / wall, 1),
+        "rps_per_core": round(args.requests / cpu, 1),
+    }
+
+
+def child(args):
+    from benchmarks.load import configure
+
+    configure(argparse.Namespace(database_url=None, sync_database_url=None))
+    # keep the limiter out of the way, both modes would pay for it equally
+    os.environ["RATE_LIMITS"] = ""
+    print(json.dumps(asyncio.run(measure(args))))
+
+
+def run_mode(args, fast_path: bool) -> dict:
+    env = dict(os.environ, REDIRECT_FAST_PATH="true" if fast_path else "false")
+    command = [sys.executable, "-m", "benchmarks.redirect_bench", "--child",
+               "--links", str(args.links), "--requests", str(args.requests), "--concurrency", str(args.concurrency)]
+    output = subprocess.check_output(command, env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        return child(args)
+
+    results = {"fastapi_handler": run_mode(args, fast_path=False), "fast_path": run_mode(args, fast_path=True)}
+    speedup = results["fast_path"]["rps_per_core"] / results["fastapi_handler"]["rps_per_core"]
+    results["speedup_per_core"] = round(speedup, 2)
+    print(json.dumps(results, indent=2))
+
+    errors = results["fast_path"]["errors"] + results["fastapi_handler"]["errors"]
+    if errors or speedup < args.min_speedup:
+        print(f"FAIL: speedup {speedup:.2f}, required {args.min_speedup}, errors {errors}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Cold start check for a web worker.
+
+Imports main:app in a fresh interpreter against fakeredis and SQLite, runs the
+startup hooks and times the first request that has to open a database
+connection. Fails when the budget is exceeded or when the web process pulled
+in the Celery worker or built the sync engine:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.startup_bench --import-budget 1.5 --first-request-budget 0.25
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+
+# modules a web worker has no business importing
+FORBIDDEN_MODULES = ("celery", "later.celery_work", "psycopg2")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-budget", type=float, default=1.5, help="seconds for `import main`")
+    parser.add_argument("--first-request-budget", type=float, default=0.25, help="seconds for the first request")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters, the slowest run is reported")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+async def measure() -> dict:
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+
+    started = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - started
+
+    import httpx
+    import redis_client
+    from database import Base, _engines, get_async_engine
+
+    server = fakeredis.FakeServer()
+    for db in (redis_client.REDIS_CACHE_DB, redis_client.REDIS_CELERY_DB):
+        redis_client.register_redis(db, fake_aioredis.FakeRedis(server=server, db=db))
+
+    # the warmup and filter tasks started by the startup hooks need the schema
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    await main.app.router.startup()
+    startup_seconds = time.perf_counter() - started
+
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            response = await client.get("/links/search/", params={"original_url": "https://example.com/cold"})
+            first_request_seconds = time.perf_counter() - started
+    finally:
+        await main.app.router.shutdown()
+
+    return {
+        "import_seconds": round(import_seconds, 4),
+        "startup_seconds": round(startup_seconds, 4),
+        "first_request_seconds": round(first_request_seconds, 4),
+        "first_request_status": response.status_code,
+        "startup_report": main.startup_report,
+        "forbidden_modules": [name for name in FORBIDDEN_MODULES if name in sys.modules],
+        "sync_engine_built": "sync" in _engines,
+    }
+
+
+def child():
+    from benchmarks.load import configure
+
+    configure(argparse.Namespace(database_url=None, sync_database_url=None))
+    print(json.dumps(asyncio.run(measure())))
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        return child()
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, "-m", "benchmarks.startup_bench", "--child"], text=True)
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    worst = {key: max(run[key] for run in runs)
+             for key in ("import_seconds", "startup_seconds", "first_request_seconds")}
+    print(json.dumps({"worst": worst, "runs": runs}, indent=2))
+
+    failures = []
+    if worst["import_seconds"] > args.import_budget:
+        failures.append(f"import took {worst['import_seconds']}s, budget {args.import_budget}s")
+    if worst["first_request_seconds"] > args.first_request_budget:
+        failures.append(f"first request took {worst['first_request_seconds']}s, budget {args.first_request_budget}s")
+    for run in runs:
+        if run["first_request_status"] != 404:
+            failures.append(f"first request answered {run['first_request_status']}, expected 404")
+        if run["forbidden_modules"]:
+            failures.append(f"web process imported {', '.join(run['forbidden_modules'])}")
+        if run["sync_engine_built"]:
+            failures.append("web process built the sync engine")
+
+    for failure in sorted(set(failures)):
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
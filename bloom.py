@@ -0,0 +1,174 @@
+import hashlib
+import math
+import time
+from typing import Optional
+
+from redis import asyncio as aioredis
+from sqlalchemy import func, select
+
+from config import BLOOM_CAPACITY, BLOOM_FP_RATE
+from database import async_session_maker, LinkCode
+
+
+BLOOM_KEY = "bloom:links"
+BLOOM_CHANNEL = "bloom:reload"
+# code -> creation time of every code created since the shared filter was built,
+# replayed into each load so the filter a worker ends up with is never missing a code
+BLOOM_RECENT = "bloom:recent"
+# a rebuild keeps codes created up to this long before its scan, covers clock skew between hosts
+RECENT_MARGIN = 300
+
+
+class BloomFilter:
+
+    def __init__(self, bits: int, hashes: int, data: Optional[bytes] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = BLOOM_FP_RATE) -> "BloomFilter":
+        capacity = max(capacity, 1)
+        bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+
+    def _positions(self, code: str):
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for n in range(self.hashes):
+            yield (first + n * second) % self.bits
+
+    def add(self, code: str):
+        for position in self._positions(code):
+            self.data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, code: str) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(code))
+
+    def expected_fp_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def dumps(self) -> bytes:
+        return f"{self.bits}:{self.hashes}:{self.count}:".encode() + bytes(self.data)
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "BloomFilter":
+        bits, hashes, count, data = raw.split(b":", 3)
+        bloom = cls(int(bits), int(hashes), data)
+        bloom.count = int(count)
+        return bloom
+
+
+class LinkFilter:
+    """Per-worker view of the shared filter; without a loaded filter every code passes."""
+
+    def __init__(self):
+        self.bloom: Optional[BloomFilter] = None
+        self.rejected = 0
+        self.false_positives = 0
+
+    def might_exist(self, code: str) -> bool:
+        if self.bloom is None or code in self.bloom:
+            return True
+        self.rejected += 1
+        return False
+
+    def missed(self, code: str):
+        """The database has no such code: a false positive, if a loaded filter let it through."""
+        if self.bloom is not None and code in self.bloom:
+            self.false_positives += 1
+
+    def add(self, *codes: str):
+        if self.bloom is not None:
+            for code in codes:
+                self.bloom.add(code)
+
+    def stats(self) -> dict:
+        if self.bloom is None:
+            return {"loaded": 0}
+
+        negatives = self.rejected + self.false_positives
+        return {
+            "loaded": 1,
+            "bits": self.bloom.bits,
+            "hashes": self.bloom.hashes,
+            "items": self.bloom.count,
+            "expected_fp_rate": self.bloom.expected_fp_rate(),
+            "observed_fp_rate": self.false_positives / negatives if negatives else 0.0,
+            "rejected": self.rejected,
+            "false_positives": self.false_positives,
+        }
+
+
+link_filter = LinkFilter()
+
+
+async def remember_codes(redis: aioredis.Redis, *codes: str):
+    """Records new codes for every worker that loads the shared filter before the next rebuild."""
+    if codes:
+        now = time.time()
+        await redis.zadd(BLOOM_RECENT, {code: now for code in codes})
+
+
+async def load_filter(redis: aioredis.Redis, target: LinkFilter = link_filter) -> bool:
+    # one snapshot of both keys, a rebuild swaps the filter and trims the recent codes together
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.get(BLOOM_KEY)
+        pipe.zrange(BLOOM_RECENT, 0, -1)
+        raw, recent = await pipe.execute()
+
+    if raw is None:
+        # the shared filter was dropped, let everything through until the next rebuild
+        target.bloom = None
+        return False
+
+    bloom = BloomFilter.loads(raw)
+    for code in recent:
+        bloom.add(code.decode())
+    target.bloom = bloom
+    return True
+
+
+async def reset_filter(redis: aioredis.Redis):
+    """For bulk changes that bypass the per-code invalidation messages."""
+    await redis.delete(BLOOM_KEY)
+    await redis.publish(BLOOM_CHANNEL, "reset")
+
+
+async def _build_from_db() -> BloomFilter:
+    async with async_session_maker() as session:
+        count = await session.scalar(select(func.count()).select_from(LinkCode))
+        bloom = BloomFilter.for_capacity(max(BLOOM_CAPACITY, 2 * count))
+        async for code in await session.stream_scalars(select(LinkCode.code).execution_options(yield_per=10000)):
+            bloom.add(code)
+    return bloom
+
+
+async def init_filter(redis: aioredis.Redis, target: LinkFilter = link_filter):
+    if await load_filter(redis, target):
+        return
+
+    started = time.time()
+    bloom = await _build_from_db()
+    # another worker may have published one meanwhile, both are complete
+    if await redis.set(BLOOM_KEY, bloom.dumps(), nx=True):
+        await redis.zremrangebyscore(BLOOM_RECENT, "-inf", started - RECENT_MARGIN)
+    await load_filter(redis, target)
+
+
+async def rebuild_filter(redis: aioredis.Redis) -> BloomFilter:
+    """Rebuilds the shared filter from link_codes, run by rebuild_bloom_task and the scheduler."""
+    started = time.time()
+    bloom = await _build_from_db()
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(BLOOM_KEY, bloom.dumps())
+        # codes created before the scan started are in the new filter, the rest stay to be replayed
+        pipe.zremrangebyscore(BLOOM_RECENT, "-inf", started - RECENT_MARGIN)
+        pipe.publish(BLOOM_CHANNEL, "reload")
+        await pipe.execute()
+    return bloom
@@ -1,8 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from redis import asyncio as aioredis
 
+from bloom import BLOOM_CHANNEL, link_filter, load_filter, remember_codes
+from config import LINK_CACHE_SIZE, LINK_CACHE_TTL, LINK_CACHE_NEGATIVE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL
+from redis_client import get_redis, REDIS_CACHE_DB
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "links:invalidate"
+INVALIDATE_USERS_CHANNEL = "users:invalidate"
+
 
 async def init_cache():
-    redis = aioredis.from_url("redis://loaclhost:6379/0", encoding="utf8", decode_response=True)
-    FastAPICache.init(RedisBackend(redis), "fastapi_cache")
+    FastAPICache.init(RedisBackend(get_redis(REDIS_CACHE_DB)), "fastapi_cache")
+
+
+class CachedLink(NamedTuple):
+    link_id: int
+    long_url: str
+    expires_at: Optional[datetime]
+    exact_clicks: bool = False
+
+    def dumps(self) -> str:
+        return json.dumps({
+            "link_id": self.link_id,
+            "long_url": self.long_url,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "exact_clicks": self.exact_clicks,
+        })
+
+    @classmethod
+    def loads(cls, raw) -> "CachedLink":
+        data = json.loads(raw)
+        expires_at = data["expires_at"]
+        return cls(data["link_id"],
+                   data["long_url"],
+                   datetime.fromisoformat(expires_at) if expires_at else None,
+                   data.get("exact_clicks", False))
+
+
+MISSING = object()
+
+REDIS_CACHE_TTL = 6000
+
+
+def cache_ttl(expires_at: Optional[datetime], now: Optional[datetime] = None) -> int:
+    """Redis TTL for a cached link, a key never outlives the link it points to."""
+    if not expires_at:
+        return REDIS_CACHE_TTL
+    return max(1, min(REDIS_CACHE_TTL, int((expires_at - (now or datetime.now())).total_seconds())))
+
+
+class TTLCache:
+    """Per-worker LRU with TTL eviction, None values are kept for negative_ttl."""
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+
+        value, deadline = item
+        if deadline < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _ttl(self, value) -> float:
+        return self.ttl if value is not None else self.negative_ttl
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self._ttl(value))
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class LinkCache(TTLCache):
+    """Short code -> CachedLink, None marks a known missing code."""
+
+    def _ttl(self, value: Optional[CachedLink]) -> float:
+        ttl = super()._ttl(value)
+        if value is not None and value.expires_at:
+            # never serve a link from memory past its own expiry
+            ttl = min(ttl, max((value.expires_at - datetime.now()).total_seconds(), 0))
+        return ttl
+
+
+link_cache = LinkCache(LINK_CACHE_SIZE, LINK_CACHE_TTL, LINK_CACHE_NEGATIVE_TTL)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+async def invalidate_links(redis: aioredis.Redis, *codes: str):
+    codes = [code for code in codes if code]
+    if not codes:
+        return
+
+    link_cache.invalidate(*codes)
+    # a changed code may be a brand new one, no filter may reject it, including ones loaded later
+    link_filter.add(*codes)
+    await remember_codes(redis, *codes)
+
+    await redis.delete(*[f"cache:{code}" for code in codes])
+    await redis.publish(INVALIDATE_CHANNEL, json.dumps(codes))
+
+
+async def invalidate_user(redis: aioredis.Redis, user_id):
+    user_cache.invalidate(str(user_id))
+    await redis.publish(INVALIDATE_USERS_CHANNEL, str(user_id))
+
+
+async def listen_invalidations():
+    while True:
+        try:
+            async with get_redis(REDIS_CACHE_DB).pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATE_CHANNEL, INVALIDATE_USERS_CHANNEL, BLOOM_CHANNEL)
+                # anything may have changed while we were not subscribed
+                link_cache.clear()
+                user_cache.clear()
+                await load_filter(get_redis(REDIS_CACHE_DB))
+
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+
+                    channel = message["channel"].decode()
+                    if channel == BLOOM_CHANNEL:
+                        await load_filter(get_redis(REDIS_CACHE_DB))
+                    elif channel == INVALIDATE_USERS_CHANNEL:
+                        user_cache.invalidate(message["data"].decode())
+                    else:
+                        codes = json.loads(message["data"])
+                        link_cache.invalidate(*codes)
+                        link_filter.add(*codes)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Link cache invalidation listener failed: {str(e)}")
+            await asyncio.sleep(1)
@@ -11,6 +11,77 @@ DB_NAME = os.getenv("DB_NAME")
 
 DB_URL= f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-REDIS_URL = os.getenv("REDIS_URL")
+DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+SYNC_DATABASE_URL = os.getenv("SYNC_DATABASE_URL", DB_URL)
+# optional streaming replica for read-only handlers, unset means everything reads from the primary
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
 
-CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
\ No newline at end of file
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+
+LINK_CACHE_SIZE = int(os.getenv("LINK_CACHE_SIZE", 10000))
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", 60))
+LINK_CACHE_NEGATIVE_TTL = int(os.getenv("LINK_CACHE_NEGATIVE_TTL", 5))
+
+VIEWS_FLUSH_INTERVAL = float(os.getenv("VIEWS_FLUSH_INTERVAL", 10))
+VIEWS_FLUSH_BATCH = int(os.getenv("VIEWS_FLUSH_BATCH", 1000))
+
+SHORTEN_BATCH_MAX = int(os.getenv("SHORTEN_BATCH_MAX", 100000))
+SHORTEN_BATCH_CHUNK = int(os.getenv("SHORTEN_BATCH_CHUNK", 1000))
+
+CODE_ALLOCATOR = os.getenv("CODE_ALLOCATOR", "block")
+CODE_LENGTH = int(os.getenv("CODE_LENGTH", 7))
+CODE_BLOCK_SIZE = int(os.getenv("CODE_BLOCK_SIZE", 1000))
+CODE_SHUFFLE_KEY = os.getenv("CODE_SHUFFLE_KEY", "SECRET")
+
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", 5000))
+# links are expired on time from the Redis expiry index, the sweep only catches what is missing from it
+CLEANUP_INTERVAL = float(os.getenv("CLEANUP_INTERVAL", 3600))
+EXPIRY_POLL_INTERVAL = float(os.getenv("EXPIRY_POLL_INTERVAL", 1))
+EXPIRY_BATCH = int(os.getenv("EXPIRY_BATCH", 1000))
+
+ARCHIVE_GRACE_DAYS = float(os.getenv("ARCHIVE_GRACE_DAYS", 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 5000))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))
+
+STATS_MAX_BUCKETS = int(os.getenv("STATS_MAX_BUCKETS", 1440))
+STATS_ROLLUP_INTERVAL = float(os.getenv("STATS_ROLLUP_INTERVAL", 60))
+STATS_ROLLUP_BATCH = int(os.getenv("STATS_ROLLUP_BATCH", 500))
+
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 10000))
+WARMUP_TIME_BUDGET = float(os.getenv("WARMUP_TIME_BUDGET", 10))
+WARMUP_BATCH = int(os.getenv("WARMUP_BATCH", 500))
+
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", 1000000))
+BLOOM_FP_RATE = float(os.getenv("BLOOM_FP_RATE", 0.01))
+BLOOM_REBUILD_INTERVAL = float(os.getenv("BLOOM_REBUILD_INTERVAL", 600))
+
+# route=capacity/seconds, e.g. "shorten=20/60,redirect=300/60"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "shorten=60/60,shorten_batch=10/60,redirect=600/60")
+# share of a bucket a worker leases to skip the Redis round trip, 0 checks every request in Redis;
+# leases hold tokens other workers cannot use, so keep it small next to capacity / worker count
+RATE_LIMIT_LOCAL_SHARE = float(os.getenv("RATE_LIMIT_LOCAL_SHARE", 0))
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+
+# per-click events: the stream is trimmed past MAXLEN, so a stalled consumer costs old events, not Redis memory
+CLICK_STREAM_MAXLEN = int(os.getenv("CLICK_STREAM_MAXLEN", 1000000))
+CLICK_INGEST_BATCH = int(os.getenv("CLICK_INGEST_BATCH", 5000))
+CLICK_INGEST_BLOCK_MS = int(os.getenv("CLICK_INGEST_BLOCK_MS", 1000))
+CLICK_INGEST_CLAIM_IDLE_MS = int(os.getenv("CLICK_INGEST_CLAIM_IDLE_MS", 60000))
+
+# run cleanup and maintenance inside the web workers instead of Celery beat, enable one or the other
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", 0.1))
+
+# temporary: 307 without caching headers, cacheable: 302, permanent: 301,
+# the last two carry max-age up to REDIRECT_MAX_AGE and never past the link's expiry
+REDIRECT_MODE = os.getenv("REDIRECT_MODE", "temporary")
+REDIRECT_MAX_AGE = int(os.getenv("REDIRECT_MAX_AGE", 3600))
+SEARCH_MAX_AGE = int(os.getenv("SEARCH_MAX_AGE", 60))
+
+# answer cached redirects below FastAPI, see shorten/fastpath.py
+REDIRECT_FAST_PATH = os.getenv("REDIRECT_FAST_PATH", "true").lower() in ("1", "true", "yes")
@@ -1,22 +1,23 @@
 from collections.abc import AsyncGenerator
 from fastapi import Depends
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker
-from sqlalchemy import Integer, String, TIMESTAMP, Boolean, ForeignKey, func, create_engine
+from sqlalchemy import (BigInteger, Engine, Integer, String, TIMESTAMP, Boolean, ForeignKey, Index, LargeBinary, Sequence, func,
+                        create_engine, text)
 from datetime import datetime
 from typing import Optional
 
-from config import DB_USER, DB_PASS, DB_HOST, DB_NAME, DB_PORT
-
-
-DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+from config import DATABASE_URL, READ_DATABASE_URL, SYNC_DATABASE_URL
 
 
 class Base(DeclarativeBase):
     pass
 
 
+link_code_seq = Sequence("link_code_seq", metadata=Base.metadata)
+
+
 class User(SQLAlchemyBaseUserTableUUID, Base):
 
     __tablename__ = "user"
@@ -39,21 +40,145 @@ class Link(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"))
     long_url: Mapped[str] = mapped_column(String, nullable=False)
+    long_url_hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary(16), nullable=True, index=True)
     short_url: Mapped[str] = mapped_column(String, nullable=True)
     created_at: Mapped[datetime.timestamp] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
     views: Mapped[int] = mapped_column(Integer, default=0)
     custom_alias: Mapped[Optional[str]] = mapped_column(String, unique=True, nullable=True)
     expires_at: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP, nullable=True)
+    # opt out of cacheable redirects, every click has to reach us to be counted
+    exact_clicks: Mapped[bool] = mapped_column(Boolean, default=False, server_default=text("false"), nullable=False)
     user = relationship("User", back_populates="links")
+    codes = relationship("LinkCode", back_populates="link", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_links_expires_at_live", "expires_at",
+              postgresql_where=text("short_url IS NOT NULL AND expires_at IS NOT NULL")),
+        Index("ix_links_expires_at_cleaned", "expires_at",
+              postgresql_where=text("short_url IS NULL AND expires_at IS NOT NULL")),
+        Index("ix_links_views_live", text("views DESC"), text("id DESC"),
+              postgresql_where=text("short_url IS NOT NULL")),
+        Index("ix_links_user_id_id", "user_id", "id"),
+        Index("ix_links_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_links_user_id_views", "user_id", "views", "id"),
+    )
+
+
+class LinkStat(Base):
+
+    __tablename__ = "link_stats"
+
+    # no foreign key, the rows outlive their link once it is moved to links_archive
+    link_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    granularity: Mapped[str] = mapped_column(String(length=8), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True)
+    clicks: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    visitors: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ViewFlush(Base):
+    """Batches of view deltas already added to links.views, written in the same transaction as the UPDATE."""
+
+    __tablename__ = "view_flushes"
+
+    batch_id: Mapped[str] = mapped_column(String(length=32), primary_key=True)
+    flushed_at: Mapped[datetime] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
 
 
-async_engine = create_async_engine(DATABASE_URL)
-async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
+class LinkCode(Base):
 
-sync_engine = create_engine(DATABASE_URL)
-sync_session_maker = sessionmaker(sync_engine,
-                                  expire_on_commit=False,
-                                  autoflush=False)
+    __tablename__ = "link_codes"
+
+    code: Mapped[str] = mapped_column(String, primary_key=True)
+    link_id: Mapped[int] = mapped_column(Integer, ForeignKey("links.id", ondelete="CASCADE"), index=True)
+    link = relationship("Link", back_populates="codes")
+
+
+class Click(Base):
+    """One row per redirect, loaded in bulk from the click stream by later/click_ingest.py."""
+
+    __tablename__ = "clicks"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    link_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    clicked_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=False)
+    visitor: Mapped[str] = mapped_column(String(length=16), nullable=False)
+    referrer: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    user_agent: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_clicks_link_id_clicked_at", "link_id", "clicked_at"),
+    )
+
+
+class LinkArchive(Base):
+    """Links expired for longer than ARCHIVE_GRACE_DAYS, moved out of the hot table by archive_task."""
+
+    __tablename__ = "links_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), index=True)
+    long_url: Mapped[str] = mapped_column(String, nullable=False)
+    long_url_hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary(16), nullable=True)
+    short_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    custom_alias: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=False)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP, nullable=True)
+    views: Mapped[int] = mapped_column(Integer, default=0)
+    archived_at: Mapped[datetime] = mapped_column(TIMESTAMP, server_default=func.now(), nullable=False)
+
+
+class LinkCodeArchive(Base):
+
+    __tablename__ = "link_codes_archive"
+
+    # an archived alias is free again, the next owner of the code gets archived next to the first one
+    code: Mapped[str] = mapped_column(String, primary_key=True)
+    link_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+
+
+# engines are built on first use, a process only connects with the engines it actually uses
+_engines: dict = {}
+
+
+def get_async_engine() -> AsyncEngine:
+    if "primary" not in _engines:
+        _engines["primary"] = create_async_engine(DATABASE_URL)
+    return _engines["primary"]
+
+
+def get_read_engine() -> AsyncEngine:
+    if not READ_DATABASE_URL:
+        return get_async_engine()
+    if "replica" not in _engines:
+        _engines["replica"] = create_async_engine(READ_DATABASE_URL)
+    return _engines["replica"]
+
+
+def get_sync_engine() -> Engine:
+    if "sync" not in _engines:
+        _engines["sync"] = create_engine(SYNC_DATABASE_URL)
+    return _engines["sync"]
+
+
+class LazySessionMaker:
+    """Drop-in for a sessionmaker whose engine is only created with the first session."""
+
+    def __init__(self, build):
+        self._build = build
+        self._maker = None
+
+    def __call__(self, **kwargs):
+        if self._maker is None:
+            self._maker = self._build()
+        return self._maker(**kwargs)
+
+
+async_session_maker = LazySessionMaker(lambda: async_sessionmaker(get_async_engine(), expire_on_commit=False))
+read_session_maker = LazySessionMaker(lambda: async_sessionmaker(get_read_engine(), expire_on_commit=False))
+sync_session_maker = LazySessionMaker(lambda: sessionmaker(get_sync_engine(),
+                                                           expire_on_commit=False,
+                                                           autoflush=False))
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
@@ -61,5 +186,19 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with read_session_maker() as session:
+        yield session
+
+
+def has_replica() -> bool:
+    return bool(READ_DATABASE_URL)
+
+
+def engines() -> dict:
+    """Async engines built so far, keyed by role."""
+    return {name: engine for name, engine in _engines.items() if name != "sync"}
+
+
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
     yield SQLAlchemyUserDatabase(session, User)
\ No newline at end of file
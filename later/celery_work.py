@@ -1,25 +1,22 @@
 from celery import Celery
-from celery.schedules import crontab
-from sqlalchemy import delete, select, update
-from database import async_session_maker, Link, sync_session_maker
-from redis import Redis
-from datetime import datetime
-import os
+from config import (VIEWS_FLUSH_INTERVAL, STATS_ROLLUP_INTERVAL, BLOOM_REBUILD_INTERVAL, ARCHIVE_INTERVAL,
+                    CLEANUP_INTERVAL, EXPIRY_POLL_INTERVAL)
+from later.maintenance import (archive_expired, cleanup_expired, expire_due, flush_views, rebuild_bloom, rollup_stats,
+                               run_job)
+from metrics import rows_per_second
+from redis_client import REDIS_CELERY_DB, redis_url
+import asyncio
 import logging
 
 
-REDIS_CACHE_DB = 0
-REDIS_CELERY_DB = 1
-
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 celery = Celery(__name__)
 celery.conf.update(
-    broker_url=f"redis://localhost:6379/{REDIS_CELERY_DB}",
-    result_backend=f"redis://localhost:6379/{REDIS_CELERY_DB}",
+    broker_url=redis_url(REDIS_CELERY_DB),
+    result_backend=redis_url(REDIS_CELERY_DB),
     task_serializer='json',
     result_serializer='json',
     accept_content=['json'],
@@ -36,6 +33,26 @@ celery.conf.update(
 )
 
 
+# One loop per worker process: the async engine and Redis pools are bound to the loop
+# they were opened on, so every task of the process has to run on the same one.
+# Tasks run one at a time per process, use the prefork or solo pool.
+_loop = None
+
+
+def run_maintenance(name: str, job, result: str) -> dict:
+    """Runs one of the jobs in later/maintenance.py, the same code the in-app scheduler runs."""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    rows, duration = _loop.run_until_complete(run_job(name, job))
+    return {
+        "status": "success",
+        result: rows,
+        "duration_seconds": round(duration, 3),
+        "rows_per_second": round(rows_per_second(rows, duration), 1),
+    }
+
+
 @celery.task(
     name="cleanup_task",
     bind=True,
@@ -47,43 +64,92 @@ celery.conf.update(
 def cleanup_expired_links(self):
     try:
         logger.info("Starting periodic cleanup task...")
+        return run_maintenance("cleanup_task", cleanup_expired, "cleaned_links")
+
+    except Exception as e:
+        logger.error(f"Cleanup failed: {str(e)}")
+        raise self.retry(exc=e, countdown=60)
+
 
+@celery.task(
+    name="expire_due_task",
+    bind=True,
+    ignore_result=True,
+    queue='cleanup_queue'
+)
+def expire_due_links(self):
+    return run_maintenance("expire_due_task", expire_due, "expired_links")
 
-        with sync_session_maker() as session:
 
-            expired_links = session.execute(
-                select(Link).where(
-                    Link.expires_at < datetime.now(),
-                    Link.short_url.isnot(None)))
+@celery.task(
+    name="archive_task",
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=5,
+    retry_kwargs={'max_retries': 3},
+    queue='cleanup_queue'
+)
+def archive_expired_links(self):
+    return run_maintenance("archive_task", archive_expired, "archived_links")
 
-            for link in expired_links:
-                link.short_url=None
-            session.commit()
 
-            redis_cache = Redis.from_url(f"redis://localhost:6379/{REDIS_CACHE_DB}")
-            redis_celery = Redis.from_url(f"redis://localhost:6379/{REDIS_CELERY_DB}")
+@celery.task(
+    name="flush_views_task",
+    bind=True,
+    ignore_result=True,
+    queue='cleanup_queue'
+)
+def flush_pending_views(self):
+    return run_maintenance("flush_views_task", flush_views, "flushed_links")
 
-            for link in expired_links:
-                redis_cache.delete(f"cache:{link.short_url}")
-                redis_cache.delete(f"clicks:{link.short_url}")
 
+@celery.task(
+    name="rollup_stats_task",
+    bind=True,
+    queue='cleanup_queue'
+)
+def rollup_click_stats(self):
+    return run_maintenance("rollup_stats_task", rollup_stats, "rolled_links")
 
-            logger.info(f"Cleaned {len(expired_links)} expired links")
-            return {
-                "status": "success",
-                "cleaned_links": len(expired_links),
-                "details": [link.id for link in expired_links]
-            }
 
-    except Exception as e:
-        logger.error(f"Cleanup failed: {str(e)}")
-        raise self.retry(exc=e, countdown=60)
+@celery.task(
+    name="rebuild_bloom_task",
+    bind=True,
+    queue='cleanup_queue'
+)
+def rebuild_link_filter(self):
+    return run_maintenance("rebuild_bloom_task", rebuild_bloom, "codes")
 
 
 celery.conf.beat_schedule = {
+    'expire-due': {
+        'task': 'expire_due_task',
+        'schedule': EXPIRY_POLL_INTERVAL,
+        'options': {'queue': 'cleanup_queue'}
+    },
     '15min-cleanup': {
         'task': 'cleanup_task',
-        'schedule': crontab(minute='*/1'),
+        'schedule': CLEANUP_INTERVAL,
+        'options': {'queue': 'cleanup_queue'}
+    },
+    'links-archive': {
+        'task': 'archive_task',
+        'schedule': ARCHIVE_INTERVAL,
+        'options': {'queue': 'cleanup_queue'}
+    },
+    'views-flush': {
+        'task': 'flush_views_task',
+        'schedule': VIEWS_FLUSH_INTERVAL,
+        'options': {'queue': 'cleanup_queue'}
+    },
+    'bloom-rebuild': {
+        'task': 'rebuild_bloom_task',
+        'schedule': BLOOM_REBUILD_INTERVAL,
+        'options': {'queue': 'cleanup_queue'}
+    },
+    'stats-rollup': {
+        'task': 'rollup_stats_task',
+        'schedule': STATS_ROLLUP_INTERVAL,
         'options': {'queue': 'cleanup_queue'}
     },
-}
\ No newline at end of file
+}
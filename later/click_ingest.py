@@ -0,0 +1,125 @@
+"""Drains the click stream into the clicks table with COPY.
+
+Runs next to the Celery worker, as many copies as the load needs, each under
+its own consumer name in the same group:
+
+    python -m later.click_ingest --consumer ingest-1
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import time
+
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from config import CLICK_INGEST_BATCH, CLICK_INGEST_BLOCK_MS, CLICK_INGEST_CLAIM_IDLE_MS
+from database import async_session_maker
+from metrics import CLICK_METRICS, record_task_async
+from redis_client import get_redis, close_redis, REDIS_CELERY_DB
+from shorten.analytics import to_datetime
+from shorten.counters import CLICK_STREAM, CLICK_GROUP
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["link_id", "clicked_at", "visitor", "referrer", "user_agent"]
+RETRY_DELAY = 5
+
+
+def to_record(entry_id: bytes, fields: dict) -> tuple:
+    # the stream entry id starts with the millisecond it was added
+    milliseconds = int(entry_id.split(b"-")[0])
+    return (int(fields[b"l"]),
+            to_datetime(milliseconds / 1000),
+            fields[b"v"].decode(),
+            fields[b"r"].decode(errors="replace") or None,
+            fields[b"u"].decode(errors="replace") or None)
+
+
+async def ensure_group(redis: aioredis.Redis):
+    try:
+        await redis.xgroup_create(CLICK_STREAM, CLICK_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def copy_clicks(records: list[tuple]):
+    async with async_session_maker() as session:
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table("clicks", records=records, columns=COLUMNS)
+        await session.commit()
+
+
+class ClickIngester:
+    """At-least-once: entries are acknowledged only after the COPY that loaded them has committed."""
+
+    def __init__(self, consumer: str):
+        self.consumer = consumer
+        self._retry = False
+        self._next_claim = 0.0
+
+    async def read(self, redis: aioredis.Redis) -> list:
+        # entries a dead consumer read but never acknowledged
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + CLICK_INGEST_CLAIM_IDLE_MS / 1000
+            claimed = (await redis.xautoclaim(CLICK_STREAM, CLICK_GROUP, self.consumer,
+                                              CLICK_INGEST_CLAIM_IDLE_MS, "0-0", count=CLICK_INGEST_BATCH))[1]
+            if claimed:
+                return claimed
+
+        # after a failed load our own pending entries come first, ">" only hands out new ones
+        if self._retry:
+            response = await redis.xreadgroup(CLICK_GROUP, self.consumer, {CLICK_STREAM: "0"},
+                                              count=CLICK_INGEST_BATCH)
+        else:
+            response = await redis.xreadgroup(CLICK_GROUP, self.consumer, {CLICK_STREAM: ">"},
+                                              count=CLICK_INGEST_BATCH, block=CLICK_INGEST_BLOCK_MS)
+
+        entries = response[0][1] if response else []
+        if self._retry and not entries:
+            self._retry = False
+        return entries
+
+    async def run(self):
+        redis = get_redis(REDIS_CELERY_DB)
+        await ensure_group(redis)
+        logger.info(f"Click ingest {self.consumer} started")
+
+        while True:
+            # pull based: a slow database means fewer reads, the backlog waits in the capped stream
+            entries = await self.read(redis)
+            if not entries:
+                continue
+
+            started = time.perf_counter()
+            records = [to_record(entry_id, fields) for entry_id, fields in entries if fields]
+            try:
+                if records:
+                    await copy_clicks(records)
+            except Exception as e:
+                logger.error(f"Click ingest failed, {len(records)} events stay pending: {str(e)}")
+                self._retry = True
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+
+            await redis.xack(CLICK_STREAM, CLICK_GROUP, *[entry_id for entry_id, _ in entries])
+            await redis.hincrby(CLICK_METRICS, "ingested", len(records))
+            await record_task_async(redis, "click_ingest", time.perf_counter() - started, len(records))
+
+
+async def main(args):
+    try:
+        await ClickIngester(args.consumer).run()
+    finally:
+        await close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consumer", default=socket.gethostname(), help="unique per running copy")
+    asyncio.run(main(parser.parse_args()))
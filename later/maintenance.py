@@ -0,0 +1,316 @@
+"""Maintenance jobs shared by the Celery worker and the in-app scheduler.
+
+The Celery tasks and the scheduler both call the async jobs below through
+run_job, so there is one implementation of every loop. Nothing in this module
+imports Celery, so the web process can load it.
+"""
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from redis.exceptions import ResponseError
+from sqlalchemy import Integer, column, delete, func, text, update, values, select
+from sqlalchemy.dialects.postgresql import insert
+
+from bloom import rebuild_filter
+from cache import INVALIDATE_CHANNEL
+from config import (CLEANUP_BATCH_SIZE, VIEWS_FLUSH_BATCH, STATS_ROLLUP_BATCH, ARCHIVE_GRACE_DAYS, ARCHIVE_BATCH_SIZE,
+                    EXPIRY_BATCH)
+from database import async_session_maker, Link, LinkCode, LinkStat, ViewFlush
+from metrics import record_task_async, rows_per_second
+from redis_client import REDIS_CACHE_DB, REDIS_CELERY_DB, get_redis, delete_many
+from shorten.analytics import (GRANULARITIES, DIRTY_LINKS, ROLLUP_LINKS, CLOSE_GRACE, series_key, visitors_key,
+                               to_datetime)
+from shorten.counters import PENDING_VIEWS, VIEW_BATCHES, CLAIM_VIEWS, flushing_key
+from shorten.expiry import EXPIRY_INDEX, POP_DUE
+
+
+logger = logging.getLogger(__name__)
+
+# a batch id is only looked up while its Redis hash exists, which is one flush interval unless Redis is down
+VIEW_FLUSH_RETENTION = timedelta(days=1)
+
+
+def _expire(batch):
+    batch = batch.with_for_update(of=Link, skip_locked=True).cte("batch")
+    return (
+        update(Link)
+        .where(Link.id == batch.c.id)
+        .values(short_url=None)
+        .returning(batch.c.short_url, Link.custom_alias)
+    )
+
+
+def expire_batch(now: datetime):
+    """Safety net sweep over the expires_at index, catches links that never made it into the expiry index."""
+    return _expire(
+        select(Link.id, Link.short_url)
+        .where(Link.expires_at < now, Link.short_url.isnot(None))
+        .order_by(Link.expires_at)
+        .limit(CLEANUP_BATCH_SIZE)
+    )
+
+
+def expire_codes(codes: list, now: datetime):
+    """Expires exactly the links popped from the expiry index."""
+    return _expire(
+        select(Link.id, Link.short_url)
+        .join(LinkCode, LinkCode.link_id == Link.id)
+        .where(LinkCode.code.in_(codes), Link.expires_at <= now, Link.short_url.isnot(None))
+    )
+
+
+def expired_codes(expired) -> list:
+    # link_codes rows stay until the archive job moves them, so expired codes answer 410
+    # and keep their stats instead of turning into unknown codes
+    return [short_url for short_url, _ in expired] + [alias for _, alias in expired if alias]
+
+
+# one statement per batch: the codes are copied and the links moved in the same snapshot,
+# deleting from links drops their link_codes rows through the cascade
+ARCHIVE_BATCH = text("""
+    WITH batch AS (
+        SELECT id FROM links
+        WHERE short_url IS NULL AND expires_at < :cutoff
+        ORDER BY expires_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ), archived_codes AS (
+        INSERT INTO link_codes_archive (code, link_id)
+        SELECT code, link_id FROM link_codes WHERE link_id IN (SELECT id FROM batch)
+        RETURNING code
+    ), moved AS (
+        DELETE FROM links USING batch WHERE links.id = batch.id
+        RETURNING links.*
+    ), archived AS (
+        INSERT INTO links_archive (id, user_id, long_url, long_url_hash, short_url, custom_alias,
+                                   created_at, expires_at, views)
+        SELECT id, user_id, long_url, long_url_hash, short_url, custom_alias, created_at, expires_at, views
+        FROM moved
+        RETURNING id
+    )
+    SELECT (SELECT count(*) FROM archived), (SELECT array_agg(code) FROM archived_codes)
+""")
+
+
+def archive_params() -> dict:
+    return {"cutoff": datetime.now() - timedelta(days=ARCHIVE_GRACE_DAYS), "limit": ARCHIVE_BATCH_SIZE}
+
+
+def add_views(deltas: list):
+    batch = values(column("id", Integer), column("delta", Integer), name="v").data(deltas)
+    return (
+        update(Link)
+        .where(Link.id == batch.c.id)
+        .values(views=Link.views + batch.c.delta)
+    )
+
+
+def record_flush(batch_id: str):
+    """Returns the batch id only the first time it is recorded."""
+    return insert(ViewFlush).values(batch_id=batch_id).on_conflict_do_nothing().returning(ViewFlush.batch_id)
+
+
+def upsert_stats():
+    stmt = insert(LinkStat)
+    return stmt.on_conflict_do_update(
+        index_elements=[LinkStat.link_id, LinkStat.granularity, LinkStat.bucket],
+        set_={"clicks": stmt.excluded.clicks, "visitors": stmt.excluded.visitors},
+    )
+
+
+def stat_rows(link_id: int, granularity: str, counts: dict, visitors: list, now: float):
+    """Rows to upsert for one series, the buckets that are final and whether any is still open."""
+    size = GRANULARITIES[granularity]
+    rows, closed, still_open = [], [], False
+
+    for bucket, unique in zip(sorted(counts), visitors):
+        rows.append({
+            "link_id": link_id,
+            "granularity": granularity,
+            "bucket": to_datetime(bucket),
+            "clicks": counts[bucket],
+            "visitors": unique,
+        })
+        if bucket + size + CLOSE_GRACE < now:
+            closed.append((granularity, link_id, bucket))
+        else:
+            still_open = True
+
+    return rows, closed, still_open
+
+
+async def cleanup_expired() -> int:
+    now = datetime.now()
+    cleaned = 0
+    redis_cache = get_redis(REDIS_CACHE_DB)
+    redis_clicks = get_redis(REDIS_CELERY_DB)
+
+    async with async_session_maker() as session:
+        while True:
+            expired = (await session.execute(expire_batch(now))).all()
+            codes = expired_codes(expired)
+            await session.commit()
+
+            await delete_many(redis_cache, [f"cache:{code}" for code in codes])
+            await delete_many(redis_clicks, [f"clicks:{code}" for code in codes])
+            if codes:
+                await redis_cache.publish(INVALIDATE_CHANNEL, json.dumps(codes))
+
+            cleaned += len(expired)
+            if len(expired) < CLEANUP_BATCH_SIZE:
+                return cleaned
+
+
+async def expire_due() -> int:
+    """Pops the codes whose expires_at has passed, the cost follows the links that expire, not the table size."""
+    redis_cache = get_redis(REDIS_CACHE_DB)
+    redis_clicks = get_redis(REDIS_CELERY_DB)
+    pop_due = redis_clicks.register_script(POP_DUE)
+    expired_total = 0
+
+    while True:
+        now = datetime.now()
+        due = [code.decode() for code in await pop_due(keys=[EXPIRY_INDEX], args=[now.timestamp(), EXPIRY_BATCH])]
+        if not due:
+            return expired_total
+
+        try:
+            async with async_session_maker() as session:
+                expired = (await session.execute(expire_codes(due, now))).all()
+                await session.commit()
+        except Exception:
+            # back into the index, the next run picks them up again
+            await redis_clicks.zadd(EXPIRY_INDEX, {code: now.timestamp() for code in due})
+            raise
+
+        codes = expired_codes(expired)
+        await delete_many(redis_cache, [f"cache:{code}" for code in codes])
+        await delete_many(redis_clicks, [f"clicks:{code}" for code in codes])
+        if codes:
+            await redis_cache.publish(INVALIDATE_CHANNEL, json.dumps(codes))
+
+        expired_total += len(expired)
+        if len(due) < EXPIRY_BATCH:
+            return expired_total
+
+
+async def archive_expired() -> int:
+    archived = 0
+    params = archive_params()
+    redis_cache = get_redis(REDIS_CACHE_DB)
+
+    async with async_session_maker() as session:
+        while True:
+            moved, codes = (await session.execute(ARCHIVE_BATCH, params)).one()
+            await session.commit()
+
+            if codes:
+                await redis_cache.publish(INVALIDATE_CHANNEL, json.dumps(codes))
+
+            archived += moved
+            if moved < ARCHIVE_BATCH_SIZE:
+                return archived
+
+
+async def flush_views() -> int:
+    redis_clicks = get_redis(REDIS_CELERY_DB)
+    batch_id = uuid.uuid4().hex
+    await redis_clicks.register_script(CLAIM_VIEWS)(keys=[PENDING_VIEWS, flushing_key(batch_id), VIEW_BATCHES],
+                                                    args=[batch_id])
+
+    flushed = 0
+    # batches of runs that died before deleting them come along, view_flushes stops a second apply
+    for batch_id in await redis_clicks.smembers(VIEW_BATCHES):
+        batch_id = batch_id.decode()
+        deltas = [(int(link_id), int(delta))
+                  for link_id, delta in (await redis_clicks.hgetall(flushing_key(batch_id))).items()]
+
+        async with async_session_maker() as session:
+            # a concurrent run applying the same batch holds the row, this insert waits for it and then conflicts
+            if await session.scalar(record_flush(batch_id)) is not None:
+                for start in range(0, len(deltas), VIEWS_FLUSH_BATCH):
+                    await session.execute(add_views(deltas[start:start + VIEWS_FLUSH_BATCH]))
+                flushed += len(deltas)
+            await session.execute(delete(ViewFlush).where(ViewFlush.flushed_at < func.now() - VIEW_FLUSH_RETENTION))
+            await session.commit()
+
+        async with redis_clicks.pipeline(transaction=False) as pipe:
+            pipe.delete(flushing_key(batch_id))
+            pipe.srem(VIEW_BATCHES, batch_id)
+            await pipe.execute()
+
+    return flushed
+
+
+async def rollup_stats() -> int:
+    redis_clicks = get_redis(REDIS_CELERY_DB)
+    now = time.time()
+    rolled_links = 0
+
+    # one run only rolls up the links dirty when it starts, clicks during the run go to a fresh set;
+    # a set left by a run that died is finished first, the upserts are idempotent
+    try:
+        await redis_clicks.renamenx(DIRTY_LINKS, ROLLUP_LINKS)
+    except ResponseError:
+        pass
+
+    # ids leave the snapshot only after their batch is written, a dead run loses nothing
+    while link_ids := await redis_clicks.srandmember(ROLLUP_LINKS, STATS_ROLLUP_BATCH):
+        rows = []
+        closed = []
+        still_open = set()
+
+        for link_id in map(int, link_ids):
+            for granularity in GRANULARITIES:
+                counts = {int(bucket): int(clicks)
+                          for bucket, clicks in (await redis_clicks.hgetall(series_key(granularity, link_id))).items()}
+
+                async with redis_clicks.pipeline(transaction=False) as pipe:
+                    for bucket in sorted(counts):
+                        pipe.pfcount(visitors_key(granularity, link_id, bucket))
+                    visitors = await pipe.execute()
+
+                series_rows, series_closed, series_open = stat_rows(link_id, granularity, counts, visitors, now)
+                rows += series_rows
+                closed += series_closed
+                if series_open:
+                    still_open.add(link_id)
+
+        if rows:
+            async with async_session_maker() as session:
+                await session.execute(upsert_stats(), rows)
+                await session.commit()
+
+        # closed buckets are final in Postgres now, drop them from Redis
+        async with redis_clicks.pipeline(transaction=False) as pipe:
+            for granularity, link_id, bucket in closed:
+                pipe.hdel(series_key(granularity, link_id), bucket)
+                pipe.delete(visitors_key(granularity, link_id, bucket))
+            # open buckets still need their final rollup, even if the link gets no more clicks
+            if still_open:
+                pipe.sadd(DIRTY_LINKS, *still_open)
+            pipe.srem(ROLLUP_LINKS, *link_ids)
+            await pipe.execute()
+
+        rolled_links += len(link_ids)
+
+    return rolled_links
+
+
+async def rebuild_bloom() -> int:
+    bloom = await rebuild_filter(get_redis(REDIS_CACHE_DB))
+    return bloom.count
+
+
+async def run_job(name: str, job) -> tuple[int, float]:
+    """Runs a job and reports it under the same task name the Celery worker uses, returns rows and seconds."""
+    started = time.perf_counter()
+    rows = await job()
+    duration = time.perf_counter() - started
+
+    await record_task_async(get_redis(REDIS_CELERY_DB), name, duration, rows)
+    logger.info(f"{name}: {rows} rows in {duration:.3f}s ({rows_per_second(rows, duration):.0f} rows/s)")
+    return rows, duration
@@ -1,18 +1,47 @@
-from fastapi import FastAPI, Depends
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Depends, Response
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi_users import FastAPIUsers
+import asyncio
+import logging
 import uuid
-import uvicorn
 
 from auth.auth import auth_backend
 from auth.manager import get_user_manager
 from auth.schemas import UserRead, UserCreate
-from cache import init_cache
+from bloom import init_filter
+from cache import init_cache, link_cache, listen_invalidations
+from metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render
+from profiler import profiler
+from redis_client import init_redis, close_redis, pool_stats, get_clicks_redis, get_redis, REDIS_CACHE_DB
+from scheduler import scheduler
+from shorten.fastpath import RedirectFastPath
 from shorten.router import router as shorty
+from warmup import warm_cache, warmup_state
 
+from config import REDIRECT_FAST_PATH, SCHEDULER_ENABLED
 from database import User
 
 
+logger = logging.getLogger(__name__)
+
+# cold start budget of a worker: module import, then each startup step until it accepts requests
+startup_report = {"import_seconds": round(time.perf_counter() - IMPORT_STARTED, 4)}
+
+
+def mark_startup(step: str, since: float) -> float:
+    now = time.perf_counter()
+    startup_report[f"{step}_seconds"] = round(now - since, 4)
+    return now
+
+
 app = FastAPI()
+if REDIRECT_FAST_PATH:
+    app.add_middleware(RedirectFastPath)
+# added last so it is the outermost and times fast path answers too
+app.add_middleware(MetricsMiddleware)
 
 
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
@@ -30,11 +59,75 @@ app.include_router(
 app.include_router(shorty)
 
 current_active_user = fastapi_users.current_user()
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
 
 
 @app.on_event("startup")
 async def startup():
+    started = step = time.perf_counter()
+    await init_redis()
+    step = mark_startup("init_redis", step)
     await init_cache()
+    step = mark_startup("init_cache", step)
+    # warmup and the filter load run in the background, /ready reports when warmup is done
+    app.state.invalidation_listener = asyncio.create_task(listen_invalidations())
+    app.state.warmup = asyncio.create_task(warm_cache())
+    app.state.bloom = asyncio.create_task(init_filter(get_redis(REDIS_CACHE_DB)))
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    mark_startup("background_tasks", step)
+    mark_startup("startup", started)
+    logger.info(f"Startup report: {startup_report}")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.invalidation_listener.cancel()
+    app.state.warmup.cancel()
+    app.state.bloom.cancel()
+    await scheduler.stop()
+    await close_redis()
+
+
+@app.get("/cache-stats")
+async def cache_stats():
+    return link_cache.stats()
+
+
+@app.get("/redis-stats")
+async def redis_stats():
+    return pool_stats()
+
+
+@app.get("/scheduler-stats")
+async def scheduler_stats():
+    return {"running": scheduler.running, "jobs": scheduler.state}
+
+
+@app.get("/startup-stats")
+async def startup_stats():
+    return startup_report
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(warmup_state.as_dict(), status_code=200 if warmup_state.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics(redis_clicks=Depends(get_clicks_redis)):
+    return Response(await render(redis_clicks), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/debug/profiler/start")
+async def start_profiler(interval: float = 0.005, user: User = Depends(current_superuser)):
+    profiler.start(interval)
+    return {"running": profiler.running}
+
+
+@app.post("/debug/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler(user: User = Depends(current_superuser)):
+    return profiler.stop()
 
 
 # @app.post("/clean_up")
@@ -49,4 +142,6 @@ async def authenticated_route(user: User = Depends(current_active_user)):
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", log_level="info")
@@ -0,0 +1,169 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from redis.exceptions import ResponseError
+
+from shorten.counters import CLICK_STREAM, CLICK_GROUP
+
+
+TASK_METRICS = "metrics:tasks"
+CLICK_METRICS = "metrics:clicks"
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Latency of a single stage inside a handler",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+LINK_CACHE_EVENTS = Counter(
+    "link_cache_lookups_total", "Redirect resolutions by the layer that answered", ["layer"],
+)
+TASK_LAST_DURATION = Gauge(
+    "task_last_duration_seconds", "Duration of the last run of a background task", ["task"],
+)
+TASK_LAST_ROWS = Gauge(
+    "task_last_rows", "Rows handled by the last run of a background task", ["task"],
+)
+TASK_LAST_RATE = Gauge(
+    "task_last_rows_per_second", "Throughput of the last run of a background task", ["task"],
+)
+TASK_GAUGES = {"duration": TASK_LAST_DURATION, "rows": TASK_LAST_ROWS, "rate": TASK_LAST_RATE}
+CLICK_INGEST_LAG = Gauge(
+    "click_ingest_lag_events", "Click events in the stream the ingest group has not read yet",
+)
+CLICK_INGEST_LAG_SECONDS = Gauge(
+    "click_ingest_lag_seconds", "Age of the oldest click event the ingest group has not read yet",
+)
+CLICK_INGEST_PENDING = Gauge(
+    "click_ingest_pending_events", "Click events read by the ingest group but not acknowledged",
+)
+CLICK_INGESTED = Gauge(
+    "click_events_ingested", "Click events loaded into the clicks table, rate() of it is the throughput",
+)
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+
+class PoolCollector:
+    """Reads DB, Redis and link cache pool gauges at scrape time instead of on every request."""
+
+    def collect(self):
+        from bloom import link_filter
+        from cache import link_cache
+        from database import engines
+        from redis_client import pool_stats
+
+        db = GaugeMetricFamily("db_pool_connections", "SQLAlchemy pool connections", labels=["engine", "state"])
+        for name, engine in engines().items():
+            pool = engine.pool
+            if hasattr(pool, "checkedout"):
+                db.add_metric([name, "checked_out"], pool.checkedout())
+                db.add_metric([name, "checked_in"], pool.checkedin())
+                db.add_metric([name, "overflow"], pool.overflow())
+                db.add_metric([name, "size"], pool.size())
+        yield db
+
+        redis = GaugeMetricFamily("redis_pool_connections", "Redis pool connections", labels=["pool", "state"])
+        for name, stats in pool_stats().items():
+            for state, value in stats.items():
+                redis.add_metric([name, state], value)
+        yield redis
+
+        cache = GaugeMetricFamily("link_cache", "In-process link cache counters", labels=["stat"])
+        for stat, value in link_cache.stats().items():
+            cache.add_metric([stat], value)
+        yield cache
+
+        bloom = GaugeMetricFamily("link_bloom_filter", "Missing-code filter state", labels=["stat"])
+        for stat, value in link_filter.stats().items():
+            bloom.add_metric([stat], value)
+        yield bloom
+
+
+REGISTRY.register(PoolCollector())
+
+
+def rows_per_second(rows: int, duration: float) -> float:
+    return rows / duration if duration else 0.0
+
+
+async def record_task_async(redis, task: str, duration: float, rows: int):
+    """Called from Celery workers and the scheduler, which are scraped through the web app's /metrics."""
+    await redis.hset(TASK_METRICS, mapping={
+        f"{task}:duration": duration,
+        f"{task}:rows": rows,
+        f"{task}:rate": rows_per_second(rows, duration),
+    })
+
+
+async def render(redis) -> bytes:
+    for field, value in (await redis.hgetall(TASK_METRICS)).items():
+        task, kind = field.decode().rsplit(":", 1)
+        TASK_GAUGES[kind].labels(task).set(float(value))
+
+    await _click_ingest_metrics(redis)
+    return generate_latest()
+
+
+async def _click_ingest_metrics(redis):
+    CLICK_INGESTED.set(float(await redis.hget(CLICK_METRICS, "ingested") or 0))
+    try:
+        groups = await redis.xinfo_groups(CLICK_STREAM)
+    except ResponseError:
+        # no stream yet, nothing was clicked
+        return
+
+    for group in groups:
+        if group["name"].decode() != CLICK_GROUP:
+            continue
+
+        # XINFO reports lag from Redis 7 on, the age of the first unread entry works everywhere
+        CLICK_INGEST_LAG.set(group.get("lag") or 0)
+        CLICK_INGEST_PENDING.set(group["pending"])
+
+        unread = await redis.xrange(CLICK_STREAM, min=f"({group['last-delivered-id'].decode()}", count=1)
+        oldest = time.time() - int(unread[0][0].split(b"-")[0]) / 1000 if unread else 0.0
+        CLICK_INGEST_LAG_SECONDS.set(oldest)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, cheaper than BaseHTTPMiddleware on every request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route else "unmatched",
+                status,
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,45 @@
+"""Bulk-load links from a CSV or NDJSON export through COPY.
+
+    python -m migration.import_links links.ndjson --user-id 1
+    python -m migration.import_links links.csv --user-id 1 --format csv
+"""
+import argparse
+import asyncio
+import json
+
+from bloom import reset_filter
+from database import async_session_maker
+from redis_client import get_redis, close_redis, REDIS_CACHE_DB
+from shorten.codes import code_allocator
+from shorten.transfer import import_links
+
+
+READ_CHUNK = 1 << 20
+
+
+async def read_file(path: str):
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, READ_CHUNK):
+            yield chunk
+
+
+async def main(args):
+    async with async_session_maker() as session:
+        report = await import_links(session, args.user_id, read_file(args.path), args.format, code_allocator)
+
+    if report["inserted"]:
+        await reset_filter(get_redis(REDIS_CACHE_DB))
+    await close_redis()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    args = parser.parse_args()
+    args.format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    asyncio.run(main(args))
@@ -0,0 +1,51 @@
+"""add link codes
+
+Revision ID: 5c1e7a2d9b40
+Revises: 380b73b09d73
+Create Date: 2026-10-18 12:10:04.311572
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7a2d9b40'
+down_revision: Union[str, None] = '380b73b09d73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('link_codes',
+    sa.Column('code', sa.String(), nullable=False),
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['link_id'], ['links.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('code')
+    )
+    op.create_index(op.f('ix_link_codes_link_id'), 'link_codes', ['link_id'], unique=False)
+
+    # generated codes win over aliases if an old collision left both around
+    op.execute("""
+        INSERT INTO link_codes (code, link_id)
+        SELECT short_url, id FROM links
+        WHERE short_url IS NOT NULL AND short_url <> ''
+        ORDER BY id
+        ON CONFLICT (code) DO NOTHING
+    """)
+    op.execute("""
+        INSERT INTO link_codes (code, link_id)
+        SELECT custom_alias, id FROM links
+        WHERE custom_alias IS NOT NULL
+        ORDER BY id
+        ON CONFLICT (code) DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_link_codes_link_id'), table_name='link_codes')
+    op.drop_table('link_codes')
@@ -0,0 +1,28 @@
+"""add link code sequence
+
+Revision ID: 8e4b0f6a1c27
+Revises: 5c1e7a2d9b40
+Create Date: 2026-10-18 13:02:47.105238
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b0f6a1c27'
+down_revision: Union[str, None] = '5c1e7a2d9b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE SEQUENCE link_code_seq START WITH 1")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP SEQUENCE link_code_seq")
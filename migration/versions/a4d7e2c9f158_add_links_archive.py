@@ -0,0 +1,66 @@
+"""add links archive
+
+Revision ID: a4d7e2c9f158
+Revises: f19b6c3e2a48
+Create Date: 2026-10-18 18:12:47.304518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e2c9f158'
+down_revision: Union[str, None] = 'f19b6c3e2a48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('links_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('long_url', sa.String(), nullable=False),
+    sa.Column('long_url_hash', sa.LargeBinary(length=16), nullable=True),
+    sa.Column('short_url', sa.String(), nullable=True),
+    sa.Column('custom_alias', sa.String(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('expires_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('views', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_links_archive_user_id'), 'links_archive', ['user_id'], unique=False)
+    op.create_table('link_codes_archive',
+    sa.Column('code', sa.String(), nullable=False),
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('code')
+    )
+    op.create_index(op.f('ix_link_codes_archive_link_id'), 'link_codes_archive', ['link_id'], unique=False)
+
+    # stats of archived links stay where they are
+    op.drop_constraint('link_stats_link_id_fkey', 'link_stats', type_='foreignkey')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_expires_at_cleaned', 'links', ['expires_at'], unique=False,
+                        postgresql_where=sa.text('short_url IS NULL AND expires_at IS NOT NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_links_expires_at_cleaned', table_name='links', postgresql_concurrently=True)
+
+    op.execute('DELETE FROM link_stats WHERE link_id NOT IN (SELECT id FROM links)')
+    op.create_foreign_key('link_stats_link_id_fkey', 'link_stats', 'links', ['link_id'], ['id'],
+                          ondelete='CASCADE')
+
+    op.drop_index(op.f('ix_link_codes_archive_link_id'), table_name='link_codes_archive')
+    op.drop_table('link_codes_archive')
+    op.drop_index(op.f('ix_links_archive_user_id'), table_name='links_archive')
+    op.drop_table('links_archive')
@@ -0,0 +1,32 @@
+"""add expires_at partial index
+
+Revision ID: b71d3c5e8f02
+Revises: 8e4b0f6a1c27
+Create Date: 2026-10-18 13:40:12.559803
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71d3c5e8f02'
+down_revision: Union[str, None] = '8e4b0f6a1c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_expires_at_live', 'links', ['expires_at'], unique=False,
+                        postgresql_where=sa.text('short_url IS NOT NULL AND expires_at IS NOT NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_links_expires_at_live', table_name='links', postgresql_concurrently=True)
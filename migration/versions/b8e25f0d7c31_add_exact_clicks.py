@@ -0,0 +1,29 @@
+"""add exact clicks opt-out
+
+Revision ID: b8e25f0d7c31
+Revises: a4d7e2c9f158
+Create Date: 2026-10-18 19:05:11.482760
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e25f0d7c31'
+down_revision: Union[str, None] = 'a4d7e2c9f158'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # a constant default is a catalog-only change, existing rows are not rewritten
+    op.add_column('links', sa.Column('exact_clicks', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('links', 'exact_clicks')
@@ -0,0 +1,36 @@
+"""add link stats
+
+Revision ID: c3a9e1f47d56
+Revises: b71d3c5e8f02
+Create Date: 2026-10-18 14:21:33.870145
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a9e1f47d56'
+down_revision: Union[str, None] = 'b71d3c5e8f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('link_stats',
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('bucket', sa.TIMESTAMP(), nullable=False),
+    sa.Column('clicks', sa.Integer(), nullable=False),
+    sa.Column('visitors', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['link_id'], ['links.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('link_id', 'granularity', 'bucket')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('link_stats')
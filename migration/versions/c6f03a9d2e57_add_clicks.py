@@ -0,0 +1,38 @@
+"""add clicks
+
+Revision ID: c6f03a9d2e57
+Revises: b8e25f0d7c31
+Create Date: 2026-10-18 19:48:36.217054
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f03a9d2e57'
+down_revision: Union[str, None] = 'b8e25f0d7c31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('clicks',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('link_id', sa.Integer(), nullable=False),
+    sa.Column('clicked_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('visitor', sa.String(length=16), nullable=False),
+    sa.Column('referrer', sa.String(), nullable=True),
+    sa.Column('user_agent', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_clicks_link_id_clicked_at', 'clicks', ['link_id', 'clicked_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_clicks_link_id_clicked_at', table_name='clicks')
+    op.drop_table('clicks')
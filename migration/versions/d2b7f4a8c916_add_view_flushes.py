@@ -0,0 +1,32 @@
+"""add view flushes
+
+Revision ID: d2b7f4a8c916
+Revises: c6f03a9d2e57
+Create Date: 2026-10-18 21:12:40.531208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b7f4a8c916'
+down_revision: Union[str, None] = 'c6f03a9d2e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('view_flushes',
+    sa.Column('batch_id', sa.String(length=32), nullable=False),
+    sa.Column('flushed_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('view_flushes')
@@ -0,0 +1,79 @@
+"""add long url hash
+
+Revision ID: d52f8a0b6e13
+Revises: c3a9e1f47d56
+Create Date: 2026-10-18 15:05:51.224690
+
+"""
+from typing import Sequence, Union
+
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52f8a0b6e13'
+down_revision: Union[str, None] = 'c3a9e1f47d56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BACKFILL_BATCH = 10000
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+# a frozen copy of shorten.urls.url_digest as of this revision, later changes to the app must not change it
+def url_digest(url: str) -> bytes:
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        normalized = url.strip()
+    else:
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc.lower()
+        if port and DEFAULT_PORTS.get(scheme) == port:
+            netloc = netloc.rsplit(":", 1)[0]
+        normalized = urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('links', sa.Column('long_url_hash', sa.LargeBinary(length=16), nullable=True))
+
+    # every batch commits on its own, writers only wait for the rows of the current batch
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                sa.text("SELECT id, long_url FROM links WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": BACKFILL_BATCH},
+            ).all()
+            if not rows:
+                break
+
+            connection.execute(
+                sa.text("""
+                    UPDATE links SET long_url_hash = batch.digest
+                    FROM unnest(CAST(:ids AS integer[]), CAST(:digests AS bytea[])) AS batch(id, digest)
+                    WHERE links.id = batch.id
+                """),
+                {"ids": [link_id for link_id, _ in rows], "digests": [url_digest(long_url) for _, long_url in rows]},
+            )
+            last_id = rows[-1][0]
+
+        op.create_index(op.f('ix_links_long_url_hash'), 'links', ['long_url_hash'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_links_long_url_hash'), table_name='links', postgresql_concurrently=True)
+    op.drop_column('links', 'long_url_hash')
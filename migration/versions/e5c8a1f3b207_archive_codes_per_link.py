@@ -0,0 +1,37 @@
+"""archive codes per link
+
+Revision ID: e5c8a1f3b207
+Revises: d2b7f4a8c916
+Create Date: 2026-10-18 21:40:18.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c8a1f3b207'
+down_revision: Union[str, None] = 'd2b7f4a8c916'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # an alias freed by archiving can be taken and archived again, the code alone is not unique
+    op.drop_constraint('link_codes_archive_pkey', 'link_codes_archive', type_='primary')
+    op.create_primary_key('link_codes_archive_pkey', 'link_codes_archive', ['code', 'link_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # keeps the latest archived owner of every code
+    op.execute(sa.text("""
+        DELETE FROM link_codes_archive a
+        USING link_codes_archive b
+        WHERE a.code = b.code AND a.link_id < b.link_id
+    """))
+    op.drop_constraint('link_codes_archive_pkey', 'link_codes_archive', type_='primary')
+    op.create_primary_key('link_codes_archive_pkey', 'link_codes_archive', ['code'])
@@ -0,0 +1,32 @@
+"""add views index
+
+Revision ID: e8c41d2a7b95
+Revises: d52f8a0b6e13
+Create Date: 2026-10-18 16:12:09.417306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8c41d2a7b95'
+down_revision: Union[str, None] = 'd52f8a0b6e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_links_views_live', 'links', [sa.text('views DESC'), sa.text('id DESC')], unique=False,
+                        postgresql_where=sa.text('short_url IS NOT NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_links_views_live', table_name='links', postgresql_concurrently=True)
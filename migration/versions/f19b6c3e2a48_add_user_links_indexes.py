@@ -0,0 +1,39 @@
+"""add user links indexes
+
+Revision ID: f19b6c3e2a48
+Revises: e8c41d2a7b95
+Create Date: 2026-10-18 17:03:26.681920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f19b6c3e2a48'
+down_revision: Union[str, None] = 'e8c41d2a7b95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = {
+    'ix_links_user_id_id': ['user_id', 'id'],
+    'ix_links_user_id_created_at': ['user_id', 'created_at', 'id'],
+    'ix_links_user_id_views': ['user_id', 'views', 'id'],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'links', columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='links', postgresql_concurrently=True)
@@ -0,0 +1,55 @@
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread.
+
+    Output is in collapsed-stack format, ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self):
+        self.interval = 0.005
+        self.samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005):
+        if self.running:
+            return
+        self.interval = interval
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = ";".join(f"{entry.name} ({entry.filename}:{entry.lineno})"
+                                 for entry in traceback.extract_stack(frame))
+                self.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,117 @@
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, Request
+from redis import asyncio as aioredis
+
+from config import RATE_LIMITS, RATE_LIMIT_LOCAL_SHARE
+from redis_client import get_redis, REDIS_CELERY_DB
+
+
+# Token bucket refilled from the server clock. Grants up to ARGV[3] tokens at once
+# so workers can lease a few and answer the next requests without a round trip,
+# ARGV[4] returns the unused tokens of the worker's previous lease first.
+TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local refund = tonumber(ARGV[4]) or 0
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate + refund)
+
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+
+local retry_after = 0
+if granted == 0 then
+    retry_after = (1 - tokens) / rate
+end
+return {granted, tostring(retry_after)}
+"""
+
+LEASE_TTL = 1.0
+MAX_LOCAL_KEYS = 10000
+
+
+def parse_limits(spec: str) -> dict[str, tuple[float, int]]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, rule = item.split("=")
+        capacity, seconds = rule.split("/")
+        limits[route] = (int(capacity) / float(seconds), int(capacity))
+    return limits
+
+
+def client_ip(request: Request) -> str:
+    # behind a proxy run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+
+    def __init__(self, limits: dict[str, tuple[float, int]], local_share: float):
+        self.limits = limits
+        self.local_share = local_share
+        self._leases: OrderedDict = OrderedDict()
+        self._script = None
+
+    def _redis(self) -> aioredis.Redis:
+        return get_redis(REDIS_CELERY_DB)
+
+    async def check(self, route: str, key: str):
+        if route not in self.limits:
+            return
+
+        rate, capacity = self.limits[route]
+        bucket = f"ratelimit:{route}:{key}"
+        now = time.monotonic()
+
+        lease = self._leases.get(bucket)
+        if lease and lease[0] > 0 and lease[1] > now:
+            lease[0] -= 1
+            return
+
+        # an expired lease hands back what it did not use, otherwise every worker
+        # would burn its share of the burst once per LEASE_TTL
+        refund = self._leases.pop(bucket)[0] if lease else 0
+        requested = max(1, int(capacity * self.local_share))
+        granted, retry_after = await self._take(bucket, rate, capacity, requested, refund)
+
+        if not granted:
+            raise HTTPException(429, "Too many requests",
+                                headers={"Retry-After": str(max(1, math.ceil(float(retry_after))))})
+
+        if granted > 1:
+            self._leases[bucket] = [granted - 1, now + LEASE_TTL]
+        while len(self._leases) > MAX_LOCAL_KEYS:
+            evicted, (unused, _) = self._leases.popitem(last=False)
+            if unused:
+                route_limits = self.limits[evicted.split(":")[1]]
+                await self._take(evicted, *route_limits, 0, unused)
+
+    async def _take(self, bucket: str, rate: float, capacity: int, requested: int, refund: int):
+        if self._script is None:
+            self._script = self._redis().register_script(TOKEN_BUCKET)
+        return await self._script(keys=[bucket], args=[rate, capacity, requested, refund])
+
+    def limit(self, route: str, user_dependency=None):
+        if user_dependency is None:
+            async def by_ip(request: Request):
+                await self.check(route, f"ip:{client_ip(request)}")
+            return by_ip
+
+        async def by_user(user=Depends(user_dependency)):
+            await self.check(route, f"user:{user.id}")
+        return by_user
+
+
+rate_limiter = RateLimiter(parse_limits(RATE_LIMITS), RATE_LIMIT_LOCAL_SHARE)
@@ -0,0 +1,95 @@
+from collections.abc import Iterable
+from urllib.parse import urlsplit, urlunsplit
+
+from redis import Redis, ConnectionPool
+from redis import asyncio as aioredis
+
+from config import REDIS_URL, REDIS_MAX_CONNECTIONS
+
+
+REDIS_CACHE_DB = 0
+REDIS_CELERY_DB = 1
+
+PIPELINE_CHUNK = 500
+
+
+def redis_url(db: int) -> str:
+    """REDIS_URL pointed at db, whatever database path it already carries."""
+    # a path in the URL wins over from_url(db=...), so it has to be replaced, not appended to
+    parts = urlsplit(REDIS_URL)
+    return urlunsplit(parts._replace(path=f"/{db}"))
+
+
+_clients: dict[int, aioredis.Redis] = {}
+_sync_clients: dict[int, Redis] = {}
+
+
+def get_redis(db: int = REDIS_CACHE_DB) -> aioredis.Redis:
+    if db not in _clients:
+        pool = aioredis.ConnectionPool.from_url(redis_url(db), max_connections=REDIS_MAX_CONNECTIONS)
+        _clients[db] = aioredis.Redis(connection_pool=pool)
+    return _clients[db]
+
+
+def get_sync_redis(db: int = REDIS_CACHE_DB) -> Redis:
+    if db not in _sync_clients:
+        pool = ConnectionPool.from_url(redis_url(db), max_connections=REDIS_MAX_CONNECTIONS)
+        _sync_clients[db] = Redis(connection_pool=pool)
+    return _sync_clients[db]
+
+
+def register_redis(db: int, client: aioredis.Redis = None, sync_client: Redis = None):
+    """Use prebuilt clients for a db, e.g. fakeredis in benchmarks."""
+    if client is not None:
+        _clients[db] = client
+    if sync_client is not None:
+        _sync_clients[db] = sync_client
+
+
+async def init_redis():
+    for db in (REDIS_CACHE_DB, REDIS_CELERY_DB):
+        await get_redis(db).ping()
+
+
+async def close_redis():
+    for client in _clients.values():
+        await client.aclose()
+        await client.connection_pool.disconnect()
+    _clients.clear()
+
+
+async def get_cache_redis() -> aioredis.Redis:
+    return get_redis(REDIS_CACHE_DB)
+
+
+async def get_clicks_redis() -> aioredis.Redis:
+    return get_redis(REDIS_CELERY_DB)
+
+
+def _chunks(keys: list, size: int = PIPELINE_CHUNK):
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+
+async def delete_many(redis: aioredis.Redis, keys: Iterable[str]) -> int:
+    deleted = 0
+    async with redis.pipeline(transaction=False) as pipe:
+        for chunk in _chunks(list(keys)):
+            pipe.delete(*chunk)
+        for count in await pipe.execute():
+            deleted += count
+    return deleted
+
+
+def _pool_stats(pool) -> dict:
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": len(pool._in_use_connections),
+        "available": len(pool._available_connections),
+    }
+
+
+def pool_stats() -> dict:
+    stats = {f"async_db{db}": _pool_stats(client.connection_pool) for db, client in _clients.items()}
+    stats.update({f"sync_db{db}": _pool_stats(client.connection_pool) for db, client in _sync_clients.items()})
+    return stats
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, NamedTuple
+
+from redis import asyncio as aioredis
+
+from config import (CLEANUP_INTERVAL, EXPIRY_POLL_INTERVAL, ARCHIVE_INTERVAL, VIEWS_FLUSH_INTERVAL, STATS_ROLLUP_INTERVAL,
+                    BLOOM_REBUILD_INTERVAL, SCHEDULER_JITTER)
+from later.maintenance import (archive_expired, cleanup_expired, expire_due, flush_views, rebuild_bloom, rollup_stats,
+                               run_job)
+from redis_client import get_redis, REDIS_CELERY_DB
+
+
+logger = logging.getLogger(__name__)
+
+# Takes the lock or renews it when we already hold it, so the current leader keeps
+# the job for as long as it keeps showing up and anyone else takes over once it stops.
+ACQUIRE_OR_RENEW = """
+local owner = redis.call('GET', KEYS[1])
+if owner == false or owner == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class Job(NamedTuple):
+    name: str
+    interval: float
+    run: Callable[[], Awaitable[int]]
+
+
+# same names as the Celery tasks, so /metrics does not care which one ran them
+MAINTENANCE_JOBS = [
+    Job("expire_due_task", EXPIRY_POLL_INTERVAL, expire_due),
+    Job("cleanup_task", CLEANUP_INTERVAL, cleanup_expired),
+    Job("archive_task", ARCHIVE_INTERVAL, archive_expired),
+    Job("flush_views_task", VIEWS_FLUSH_INTERVAL, flush_views),
+    Job("rollup_stats_task", STATS_ROLLUP_INTERVAL, rollup_stats),
+    Job("rebuild_bloom_task", BLOOM_REBUILD_INTERVAL, rebuild_bloom),
+]
+
+
+class Scheduler:
+    """In-process alternative to Celery beat.
+
+    Every worker loops over the jobs, a Redis lock per job decides which one actually runs it."""
+
+    def __init__(self, jobs: list[Job], jitter: float):
+        self.jobs = jobs
+        self.jitter = jitter
+        self.token = uuid.uuid4().hex
+        self._tasks: list[asyncio.Task] = []
+        self._script = None
+        self.state = {job.name: {"runs": 0, "skipped": 0, "failures": 0, "last_run": None} for job in jobs}
+
+    def _redis(self) -> aioredis.Redis:
+        return get_redis(REDIS_CELERY_DB)
+
+    def _lock_ttl(self, job: Job) -> int:
+        # longer than the slowest jittered sleep, so the leader never loses the lock between its own runs
+        return int(job.interval * (1 + 2 * self.jitter) * 1000)
+
+    async def _acquire(self, job: Job) -> bool:
+        if self._script is None:
+            self._script = self._redis().register_script(ACQUIRE_OR_RENEW)
+        return bool(await self._script(keys=[f"scheduler:lock:{job.name}"], args=[self.token, self._lock_ttl(job)]))
+
+    async def _keep(self, job: Job):
+        # a run longer than the lock must not let another worker start the same job
+        while True:
+            await asyncio.sleep(self._lock_ttl(job) / 3000)
+            if not await self._acquire(job):
+                logger.warning(f"Scheduler lost the {job.name} lock during a run")
+                return
+
+    async def _tick(self, job: Job):
+        state = self.state[job.name]
+        if not await self._acquire(job):
+            state["skipped"] += 1
+            return
+
+        keeper = asyncio.create_task(self._keep(job))
+        try:
+            await run_job(job.name, job.run)
+            state["runs"] += 1
+            state["last_run"] = time.time()
+        finally:
+            keeper.cancel()
+
+    async def _loop(self, job: Job):
+        # replicas that boot together would otherwise hit Redis and the database in lockstep
+        await asyncio.sleep(random.uniform(0, job.interval * self.jitter))
+        while True:
+            try:
+                await self._tick(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.state[job.name]["failures"] += 1
+                logger.error(f"Scheduled job {job.name} failed: {str(e)}")
+
+            await asyncio.sleep(job.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+
+scheduler = Scheduler(MAINTENANCE_JOBS, SCHEDULER_JITTER)
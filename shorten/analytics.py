@@ -0,0 +1,82 @@
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+
+DIRTY_LINKS = "stats:dirty"
+# snapshot of DIRTY_LINKS a rollup run works through
+ROLLUP_LINKS = "stats:rollup"
+# a bucket is rolled up for the last time this long after it closes
+CLOSE_GRACE = 60
+# safety net for buckets a dead rollup never got to
+BUCKET_KEY_TTL = 3 * 86400
+
+
+def series_key(granularity: str, link_id) -> str:
+    return f"stats:{granularity}:{link_id}"
+
+
+def visitors_key(granularity: str, link_id, bucket) -> str:
+    return f"hll:{granularity}:{link_id}:{bucket}"
+
+
+def bucket_start(timestamp: float, granularity: str) -> int:
+    size = GRANULARITIES[granularity]
+    return int(timestamp) // size * size
+
+
+def bucket_end(timestamp: float, granularity: str) -> int:
+    """First bucket boundary at or after timestamp, the end of a window that excludes timestamp itself."""
+    size = GRANULARITIES[granularity]
+    return math.ceil(timestamp / size) * size
+
+
+def to_datetime(bucket: int) -> datetime:
+    return datetime.fromtimestamp(bucket, timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(moment: datetime) -> float:
+    # naive values are UTC, aware ones keep their offset
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+    return moment.astimezone(timezone.utc).timestamp()
+
+
+def visitor_id(ip: Optional[str], user_agent: Optional[str]) -> str:
+    return hashlib.blake2b(f"{ip}|{user_agent}".encode(), digest_size=8).hexdigest()
+
+
+def add_click(pipe, link_id: int, visitor: str, now: Optional[float] = None):
+    now = now or time.time()
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(now, granularity)
+        key = series_key(granularity, link_id)
+        pipe.hincrby(key, bucket, 1)
+        pipe.expire(key, BUCKET_KEY_TTL)
+        pipe.pfadd(visitors_key(granularity, link_id, bucket), visitor)
+        pipe.expire(visitors_key(granularity, link_id, bucket), BUCKET_KEY_TTL)
+    pipe.sadd(DIRTY_LINKS, link_id)
+
+
+async def live_buckets(redis_clicks: aioredis.Redis, link_id: int, granularity: str,
+                       start: int, end: int) -> dict[int, tuple[int, int]]:
+    """Buckets still held in Redis, i.e. newer than the last rollup."""
+
+    counts = {int(bucket): int(clicks)
+              for bucket, clicks in (await redis_clicks.hgetall(series_key(granularity, link_id))).items()}
+    buckets = sorted(bucket for bucket in counts if start <= bucket < end)
+    if not buckets:
+        return {}
+
+    async with redis_clicks.pipeline(transaction=False) as pipe:
+        for bucket in buckets:
+            pipe.pfcount(visitors_key(granularity, link_id, bucket))
+        visitors = await pipe.execute()
+
+    return {bucket: (counts[bucket], unique) for bucket, unique in zip(buckets, visitors)}
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+from typing import Union
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Link, LinkCode
+from shorten.schemas import ShortenRequest, ShortenBatchResult
+from shorten.urls import url_digest
+
+
+def parse_batch(body: bytes, ndjson: bool) -> list[Union[ShortenRequest, str]]:
+    if ndjson:
+        raw_items = [line for line in body.splitlines() if line.strip()]
+        parse = ShortenRequest.model_validate_json
+    else:
+        raw_items = json.loads(body)
+        if not isinstance(raw_items, list):
+            raise ValueError("Batch body must be a JSON array")
+        parse = ShortenRequest.model_validate
+
+    items = []
+    for raw in raw_items:
+        try:
+            items.append(parse(raw))
+        except ValidationError as e:
+            items.append(str(e.errors(include_url=False)[0]["msg"]))
+    return items
+
+
+def _error(index: int, detail: str) -> ShortenBatchResult:
+    return ShortenBatchResult(index=index, status="error", detail=detail)
+
+
+async def shorten_chunk(session: AsyncSession,
+                        user_id: int,
+                        offset: int,
+                        items: list[Union[ShortenRequest, str]],
+                        code_allocator) -> list[ShortenBatchResult]:
+
+    aliases = [item.custom_alias for item in items if isinstance(item, ShortenRequest) and item.custom_alias]
+    taken = set()
+    if aliases:
+        taken = set(await session.scalars(
+            select(LinkCode.code).where(LinkCode.code.in_(aliases + [f"{alias}.short" for alias in aliases]))
+        ))
+
+    generated = sum(1 for item in items if isinstance(item, ShortenRequest) and not item.custom_alias)
+    new_codes = iter(await code_allocator.allocate_many(session, generated) if generated else [])
+
+    now = datetime.now()
+    results: dict[int, ShortenBatchResult] = {}
+    pending = []
+
+    for index, item in enumerate(items, start=offset):
+        if isinstance(item, str):
+            results[index] = _error(index, item)
+            continue
+
+        if item.expires_at and item.expires_at < now:
+            results[index] = _error(index, "Expiration time must be in future")
+            continue
+
+        if item.custom_alias:
+            short_code = f"{item.custom_alias}.short"
+            if item.custom_alias in taken or short_code in taken:
+                results[index] = _error(index, "Alias already exists")
+                continue
+            taken.update((item.custom_alias, short_code))
+        else:
+            short_code = next(new_codes)
+
+        pending.append((index, item, short_code))
+
+    if pending:
+        try:
+            inserted = (await session.execute(
+                insert(Link).returning(Link.id, Link.created_at, sort_by_parameter_order=True),
+                [{
+                    "user_id": user_id,
+                    "long_url": item.long_url,
+                    "long_url_hash": url_digest(item.long_url),
+                    "short_url": short_code,
+                    "custom_alias": item.custom_alias,
+                    "expires_at": item.expires_at,
+                    "exact_clicks": item.exact_clicks,
+                    "views": 0,
+                } for _, item, short_code in pending]
+            )).all()
+
+            codes = []
+            for (_, item, short_code), (link_id, _) in zip(pending, inserted):
+                codes.append({"code": short_code, "link_id": link_id})
+                if item.custom_alias:
+                    codes.append({"code": item.custom_alias, "link_id": link_id})
+            await session.execute(insert(LinkCode), codes)
+
+            await session.commit()
+
+        except IntegrityError:
+            await session.rollback()
+            for index, _, _ in pending:
+                results[index] = _error(index, "Code conflict, retry")
+
+        else:
+            for (index, item, short_code), (_, created_at) in zip(pending, inserted):
+                results[index] = ShortenBatchResult(index=index,
+                                                    status="created",
+                                                    short_url=short_code,
+                                                    custom_alias=item.custom_alias,
+                                                    long_url=item.long_url,
+                                                    created_at=created_at,
+                                                    expires_at=item.expires_at)
+
+    return [results[index] for index in sorted(results)]
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import secrets
+import string
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CODE_ALLOCATOR, CODE_LENGTH, CODE_BLOCK_SIZE, CODE_SHUFFLE_KEY
+
+
+ALPHABET = string.digits + string.ascii_letters
+SUFFIX = ".ru"
+SEQUENCE = "link_code_seq"
+RANDOM_LENGTH = 12
+
+# literal paths under /links, a code equal to one of them could never be resolved
+RESERVED_CODES = frozenset({"shorten", "mine", "export", "import", "search"})
+
+
+def generate_random(length: int = RANDOM_LENGTH) -> str:
+    chars = string.ascii_letters + string.digits
+    return f"{''.join(secrets.choice(chars) for _ in range(length))}{SUFFIX}"
+
+
+class Shuffler:
+    """Keyed bijection on [0, 62**length): a small Feistel network with cycle walking,
+    so sequential ids give codes that can't be guessed from their neighbours."""
+
+    ROUNDS = 4
+
+    def __init__(self, length: int, key: str):
+        self.length = length
+        self.space = len(ALPHABET) ** length
+        self.half_bits = ((self.space - 1).bit_length() + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        self.round_keys = [
+            int.from_bytes(hashlib.blake2b(f"{key}:{n}".encode(), digest_size=8).digest(), "big")
+            for n in range(self.ROUNDS)
+        ]
+
+    def _f(self, half: int, round_key: int) -> int:
+        value = ((half ^ round_key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (value ^ (value >> 29)) & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self._f(right, round_key)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in reversed(self.round_keys):
+            left, right = right ^ self._f(left, round_key), left
+        return (left << self.half_bits) | right
+
+    def encode(self, number: int) -> str:
+        if not 0 <= number < self.space:
+            raise ValueError(f"{number} does not fit into {self.length} chars")
+
+        value = self._encrypt(number)
+        while value >= self.space:
+            value = self._encrypt(value)
+
+        chars = []
+        for _ in range(self.length):
+            value, rest = divmod(value, len(ALPHABET))
+            chars.append(ALPHABET[rest])
+        return "".join(reversed(chars))
+
+    def decode(self, code: str) -> int:
+        value = 0
+        for char in code:
+            value = value * len(ALPHABET) + ALPHABET.index(char)
+
+        value = self._decrypt(value)
+        while value >= self.space:
+            value = self._decrypt(value)
+        return value
+
+
+def sequence_number(code: str, shuffler: Shuffler) -> Optional[int]:
+    """The sequence value behind a code of the SequenceAllocator shape, None for any other code."""
+    stem = code.removesuffix(SUFFIX)
+    if stem == code or len(stem) != shuffler.length or any(char not in ALPHABET for char in stem):
+        return None
+    return shuffler.decode(stem)
+
+
+class RandomAllocator:
+    """The original generator: short and fast but uniqueness is left to chance."""
+
+    unique = False
+
+    async def allocate(self, session: AsyncSession) -> str:
+        return generate_random()
+
+    async def allocate_many(self, session: AsyncSession, count: int) -> list[str]:
+        return [generate_random() for _ in range(count)]
+
+
+class SequenceAllocator:
+    """One Postgres sequence value per code."""
+
+    unique = True
+
+    def __init__(self, shuffler: Shuffler):
+        self.shuffler = shuffler
+
+    async def _next_ids(self, session: AsyncSession, count: int) -> list[int]:
+        result = await session.scalars(
+            text(f"SELECT nextval('{SEQUENCE}') FROM generate_series(1, :count)"), {"count": count}
+        )
+        return list(result)
+
+    def _code(self, number: int) -> str:
+        return f"{self.shuffler.encode(number)}{SUFFIX}"
+
+    async def allocate(self, session: AsyncSession) -> str:
+        return (await self.allocate_many(session, 1))[0]
+
+    async def allocate_many(self, session: AsyncSession, count: int) -> list[str]:
+        return [self._code(number) for number in await self._next_ids(session, count)]
+
+
+class BlockAllocator(SequenceAllocator):
+    """Leases CODE_BLOCK_SIZE sequence values at a time and hands them out from memory."""
+
+    def __init__(self, shuffler: Shuffler, block_size: int):
+        super().__init__(shuffler)
+        self.block_size = block_size
+        self._ids: list[int] = []
+        self._lock = asyncio.Lock()
+
+    async def allocate_many(self, session: AsyncSession, count: int) -> list[str]:
+        async with self._lock:
+            if len(self._ids) < count:
+                lease = max(self.block_size, count - len(self._ids))
+                self._ids.extend(await self._next_ids(session, lease))
+
+            numbers, self._ids = self._ids[:count], self._ids[count:]
+
+        return [self._code(number) for number in numbers]
+
+
+shuffler = Shuffler(CODE_LENGTH, CODE_SHUFFLE_KEY)
+
+
+def make_allocator(mode: str = CODE_ALLOCATOR):
+    if mode == "random":
+        return RandomAllocator()
+
+    if mode == "sequence":
+        return SequenceAllocator(shuffler)
+    if mode == "block":
+        return BlockAllocator(shuffler, CODE_BLOCK_SIZE)
+
+    raise ValueError(f"Unknown CODE_ALLOCATOR {mode!r}")
+
+
+code_allocator = make_allocator()
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from config import CLICK_STREAM_MAXLEN
+from shorten.analytics import add_click
+
+
+PENDING_VIEWS = "views:pending"
+# every flush run moves the pending hash to views:flushing:<batch id> and lists the id in VIEW_BATCHES
+FLUSHING_VIEWS = "views:flushing"
+VIEW_BATCHES = "views:batches"
+
+# Claims the pending deltas under a batch of its own, so concurrent runs never read the same hash.
+CLAIM_VIEWS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+"""
+
+# Pending deltas of the given links, summed over the live hash and every batch not deleted yet.
+SUM_PENDING = """
+local totals = {}
+for i, delta in ipairs(redis.call('HMGET', KEYS[1], unpack(ARGV, 2))) do
+    totals[i] = tonumber(delta) or 0
+end
+for _, batch in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    for i, delta in ipairs(redis.call('HMGET', ARGV[1] .. ':' .. batch, unpack(ARGV, 2))) do
+        totals[i] = totals[i] + (tonumber(delta) or 0)
+    end
+end
+return totals
+"""
+
+# not under clicks:, cleanup deletes clicks:{code} and "stream" is a valid alias
+CLICK_STREAM = "events:clicks"
+CLICK_GROUP = "click_ingest"
+MAX_HEADER_LENGTH = 512
+
+
+async def record_view(redis_clicks: aioredis.Redis, short_code: str, link_id: int, visitor: str,
+                      referrer: Optional[str] = None, user_agent: Optional[str] = None) -> int:
+    async with redis_clicks.pipeline(transaction=False) as pipe:
+        pipe.incr(f"clicks:{short_code}")
+        pipe.hincrby(PENDING_VIEWS, link_id, 1)
+        add_click(pipe, link_id, visitor)
+        # rides the same round trip, the entry id carries the timestamp
+        pipe.xadd(CLICK_STREAM,
+                  {"l": link_id,
+                   "v": visitor,
+                   "r": (referrer or "")[:MAX_HEADER_LENGTH],
+                   "u": (user_agent or "")[:MAX_HEADER_LENGTH]},
+                  maxlen=CLICK_STREAM_MAXLEN, approximate=True)
+        click_count, *_ = await pipe.execute()
+
+    return click_count
+
+
+def flushing_key(batch_id: str) -> str:
+    return f"{FLUSHING_VIEWS}:{batch_id}"
+
+
+async def pending_views(redis_clicks: aioredis.Redis, link_id: int) -> int:
+    return (await pending_views_many(redis_clicks, [link_id]))[link_id]
+
+
+async def pending_views_many(redis_clicks: aioredis.Redis, link_ids: list[int]) -> dict[int, int]:
+    if not link_ids:
+        return {}
+
+    totals = await redis_clicks.register_script(SUM_PENDING)(keys=[PENDING_VIEWS, VIEW_BATCHES],
+                                                             args=[FLUSHING_VIEWS, *link_ids])
+    return dict(zip(link_ids, map(int, totals)))
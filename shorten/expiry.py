@@ -0,0 +1,24 @@
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+
+# short code -> expires_at timestamp, only links that expire are in it
+EXPIRY_INDEX = "links:expiry"
+
+# Pops the codes that are due in one step, so two consumers never get the same code.
+POP_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+async def index_expiry(redis_clicks: aioredis.Redis, entries: Iterable[tuple[str, Optional[datetime]]]):
+    mapping = {code: expires_at.timestamp() for code, expires_at in entries if code and expires_at}
+    if mapping:
+        await redis_clicks.zadd(EXPIRY_INDEX, mapping)
@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+from urllib.parse import quote
+
+from fastapi import HTTPException
+
+from cache import MISSING
+from ratelimit import rate_limiter
+from redis_client import get_redis, REDIS_CACHE_DB, REDIS_CELERY_DB
+from shorten.analytics import visitor_id
+from shorten.http_cache import redirect_policy
+from shorten.router import router, resolve_cached, count_view
+
+
+# same quoting as starlette's RedirectResponse
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+
+
+def _error(status: int, detail: str, headers: dict = None) -> tuple[dict, dict]:
+    body = json.dumps({"detail": detail}).encode()
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return ({"type": "http.response.start", "status": status, "headers": raw_headers},
+            {"type": "http.response.body", "body": body})
+
+
+NOT_FOUND = _error(404, "No such link")
+EXPIRED = _error(410, "URL expired")
+EMPTY_BODY = {"type": "http.response.body", "body": b""}
+
+
+class RedirectFastPath:
+    """Answers GET /links/{code} straight from the link caches, without dependency injection,
+    a session or a Response object. A code that needs the database goes on to the FastAPI handler."""
+
+    def __init__(self, app):
+        self.app = app
+        self.prefix = f"{router.prefix}/"
+        self.route = next(route for route in router.routes
+                          if route.path == f"{router.prefix}/{{short_code}}" and "GET" in route.methods)
+        # literal routes like /links/mine must never be taken for a code
+        self.reserved = {route.path.removeprefix(self.prefix).strip("/")
+                         for route in router.routes if "{" not in route.path}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+
+        short_code = scope["path"][len(self.prefix):]
+        if not short_code or "/" in short_code or short_code in self.reserved:
+            return await self.app(scope, receive, send)
+
+        redis_cache = get_redis(REDIS_CACHE_DB)
+        link = await resolve_cached(short_code, redis_cache)
+        if link is MISSING:
+            return await self.app(scope, receive, send)
+
+        # label metrics like the handler would have been
+        scope["route"] = self.route
+        client = scope.get("client")
+        ip = client[0] if client else None
+
+        try:
+            await rate_limiter.check("redirect", f"ip:{ip or 'unknown'}")
+        except HTTPException as e:
+            return await self._send(send, _error(e.status_code, e.detail, e.headers))
+
+        if link is None:
+            return await self._send(send, NOT_FOUND)
+        if link.expires_at and link.expires_at < datetime.now():
+            return await self._send(send, EXPIRED)
+
+        request_headers = {name: value.decode("latin-1") for name, value in scope["headers"]
+                           if name in (b"user-agent", b"referer")}
+        user_agent = request_headers.get(b"user-agent")
+        await count_view(short_code, link, visitor_id(ip, user_agent), redis_cache, get_redis(REDIS_CELERY_DB),
+                         request_headers.get(b"referer"), user_agent)
+
+        status, cache_control = redirect_policy(link)
+        headers = [(b"location", quote(link.long_url, safe=LOCATION_SAFE).encode("latin-1")),
+                   (b"content-length", b"0")]
+        if cache_control:
+            headers.append((b"cache-control", cache_control.encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send(EMPTY_BODY)
+
+    @staticmethod
+    async def _send(send, response: tuple[dict, dict]):
+        for message in response:
+            await send(message)
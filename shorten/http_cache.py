@@ -0,0 +1,43 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+from cache import CachedLink
+from config import REDIRECT_MODE, REDIRECT_MAX_AGE
+
+
+REDIRECT_STATUS = {"temporary": 307, "cacheable": 302, "permanent": 301}
+
+
+def redirect_policy(link: CachedLink, now: Optional[datetime] = None) -> tuple[int, Optional[str]]:
+    """Status and Cache-Control for a redirect, None means no caching header at all."""
+    if link.exact_clicks:
+        # browsers and CDNs must ask us every time or the click is lost
+        return 307, "no-store"
+
+    if REDIRECT_MODE == "temporary":
+        return 307, None
+
+    max_age = REDIRECT_MAX_AGE
+    if link.expires_at:
+        max_age = min(max_age, int((link.expires_at - (now or datetime.now())).total_seconds()))
+    if max_age <= 0:
+        return 307, "no-store"
+
+    return REDIRECT_STATUS[REDIRECT_MODE], f"public, max-age={max_age}"
+
+
+def etag_response(request: Request, body: bytes, cache_control: str) -> Response:
+    """JSON response with a content hash ETag, a matching If-None-Match gets an empty 304."""
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
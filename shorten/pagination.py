@@ -0,0 +1,23 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+
+def encode_cursor(value, link_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, link_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, link_id = json.loads(raw)
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        return int(value) if sort == "views" else value, int(link_id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
@@ -3,16 +3,22 @@ from typing import Optional
 from pydantic import BaseModel, field_validator
 from datetime import datetime
 
+from shorten.codes import RESERVED_CODES
+
 
 class ShortenRequest(BaseModel):
     long_url: str
     custom_alias: Optional[str] = None
     expires_at: Optional[datetime] = None
+    reuse_existing: bool = False
+    exact_clicks: bool = False
 
     @field_validator("custom_alias")
     def validate_alias(cls, v):
         if v and not v.isalnum():
             raise ValueError("Only chars and figures")
+        if v in RESERVED_CODES:
+            raise ValueError("Reserved path")
         return v
 
 
@@ -22,17 +28,44 @@ class ShortenResponse(BaseModel):
     long_url: str
     created_at: datetime
     expires_at: Optional[datetime]
+    exact_clicks: bool = False
 
 
 class LinkResponse(BaseModel):
     id: int
-    short_url: str
+    short_url: Optional[str]
+    custom_alias: Optional[str] = None
     long_url: str
     created_at: datetime
+    expires_at: Optional[datetime] = None
+    views: int = 0
+
+
+class LinkPage(BaseModel):
+    items: list[LinkResponse]
+    next_cursor: Optional[str] = None
+
+
+class StatsBucket(BaseModel):
+    bucket: datetime
+    clicks: int
+    visitors: int
 
 
 class StatsResponse(BaseModel):
     long_url: str
     created_at: datetime
     views: int
+    granularity: Optional[str] = None
+    buckets: Optional[list[StatsBucket]] = None
+
 
+class ShortenBatchResult(BaseModel):
+    index: int
+    status: str
+    short_url: Optional[str] = None
+    custom_alias: Optional[str] = None
+    long_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    detail: Optional[str] = None
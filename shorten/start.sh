@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # запуск воркера
-celery -A celery_work worker --loglevel=info -Q cleanup_queue -n cleanup_worker@%h -P eventlet
+celery -A celery_work worker --loglevel=info -Q cleanup_queue -n cleanup_worker@%h -P solo
 
 # запуск планировщика
 celery -A celery_work beat --loglevel=info --scheduler redbeat.RedBeatScheduler
@@ -0,0 +1,231 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Link
+from shorten.codes import RESERVED_CODES, SEQUENCE, sequence_number, shuffler
+from shorten.urls import url_digest
+
+
+EXPORT_COLUMNS = ["short_url", "custom_alias", "long_url", "created_at", "expires_at", "views"]
+STAGING_COLUMNS = ["row_no", "long_url", "long_url_hash", "short_url", "custom_alias",
+                   "created_at", "expires_at", "views", "code_no", "error"]
+EXPORT_CHUNK = 5000
+CODE_CHUNK = 10000
+REJECT_SAMPLE = 100
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def export_links(session: AsyncSession, user_id: Optional[int], fmt: str) -> AsyncIterator[str]:
+    query = select(*(getattr(Link, column) for column in EXPORT_COLUMNS)).order_by(Link.id)
+    if user_id is not None:
+        query = query.where(Link.user_id == user_id)
+
+    result = await session.stream(query.execution_options(yield_per=EXPORT_CHUNK))
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([[_format_value(value) for value in row] for row in rows])
+            yield buffer.getvalue()
+    else:
+        async for rows in result.partitions():
+            yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, map(_format_value, row)))) + "\n" for row in rows)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line.decode()
+    if tail.strip():
+        yield tail.decode()
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _row_error(long_url, short_url, custom_alias) -> Optional[str]:
+    if not isinstance(long_url, str) or not long_url.strip():
+        return "long_url is missing"
+
+    for field, code in (("short_url", short_url), ("custom_alias", custom_alias)):
+        if code is None:
+            continue
+        if not isinstance(code, str):
+            return f"{field} is not a string"
+        if code in RESERVED_CODES:
+            return f"{field} is a reserved path"
+
+    if custom_alias is not None and not custom_alias.isalnum():
+        return "custom_alias may only have chars and figures"
+    return None
+
+
+def _record(row_no: int, item) -> tuple:
+    """Staging row for one imported item, a row that can not be imported carries the reason in error."""
+    if not isinstance(item, dict):
+        return row_no, "", None, None, None, None, None, 0, None, "not an object"
+
+    long_url = item.get("long_url")
+    short_url = item.get("short_url") or None
+    custom_alias = item.get("custom_alias") or None
+
+    error = _row_error(long_url, short_url, custom_alias)
+    try:
+        created_at = _parse_datetime(item.get("created_at"))
+        expires_at = _parse_datetime(item.get("expires_at"))
+        views = int(item.get("views") or 0)
+    except (TypeError, ValueError):
+        error = error or "malformed created_at, expires_at or views"
+        created_at, expires_at, views = None, None, 0
+
+    # codes are kept for the report, as long as they fit the column
+    short_url = short_url if isinstance(short_url, str) else None
+    custom_alias = custom_alias if isinstance(custom_alias, str) else None
+    if error:
+        return row_no, "", None, short_url, custom_alias, created_at, expires_at, views, None, error
+
+    # an exported sequence code keeps working here once the sequence has been moved past it
+    code_no = sequence_number(short_url, shuffler) if short_url else None
+    return (row_no, long_url, url_digest(long_url), short_url, custom_alias, created_at, expires_at, views,
+            code_no, None)
+
+
+async def _records(chunks: AsyncIterator[bytes], fmt: str):
+    header = None
+    row_no = 0
+
+    async for line in _lines(chunks):
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = values
+                continue
+            item = dict(zip(header, values))
+        else:
+            item = json.loads(line)
+
+        row_no += 1
+        yield _record(row_no, item)
+
+
+async def import_links(session: AsyncSession, user_id: int, chunks: AsyncIterator[bytes],
+                       fmt: str, code_allocator) -> dict:
+    """COPY rows into a staging table, then merge the ones whose codes are free into links."""
+
+    connection = await session.connection()
+
+    await connection.execute(text("""
+        CREATE TEMP TABLE links_import (
+            row_no integer PRIMARY KEY,
+            long_url varchar NOT NULL,
+            long_url_hash bytea,
+            short_url varchar,
+            custom_alias varchar,
+            created_at timestamp,
+            expires_at timestamp,
+            views integer,
+            code_no bigint,
+            error varchar
+        ) ON COMMIT DROP
+    """))
+
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "links_import", records=_records(chunks, fmt), columns=STAGING_COLUMNS
+    )
+
+    # codes can only be allocated once COPY has released the connection
+    missing = list(await connection.scalars(
+        text("SELECT row_no FROM links_import WHERE short_url IS NULL AND error IS NULL")
+    ))
+    for start in range(0, len(missing), CODE_CHUNK):
+        rows = missing[start:start + CODE_CHUNK]
+        await connection.execute(text("""
+            UPDATE links_import s SET short_url = v.code
+            FROM unnest(CAST(:rows AS integer[]), CAST(:codes AS varchar[])) AS v(row_no, code)
+            WHERE s.row_no = v.row_no
+        """), {"rows": rows, "codes": await code_allocator.allocate_many(session, len(rows))})
+
+    await connection.execute(text("""
+        CREATE TEMP TABLE import_codes ON COMMIT DROP AS
+        SELECT short_url AS code, row_no FROM links_import WHERE error IS NULL
+        UNION ALL
+        SELECT custom_alias, row_no FROM links_import WHERE custom_alias IS NOT NULL AND error IS NULL
+    """))
+    # temp tables have no statistics, without them the planner picks nested loops
+    await connection.execute(text("ANALYZE links_import"))
+    await connection.execute(text("ANALYZE import_codes"))
+    await connection.execute(text("""
+        CREATE TEMP TABLE import_rejects ON COMMIT DROP AS
+        SELECT DISTINCT i.row_no, i.code, 'duplicate in file' AS reason
+        FROM import_codes i JOIN import_codes j ON j.code = i.code AND j.row_no < i.row_no
+        UNION
+        SELECT i.row_no, i.code, 'already exists'
+        FROM import_codes i JOIN link_codes c ON c.code = i.code
+        UNION
+        SELECT row_no, coalesce(custom_alias, short_url), error FROM links_import WHERE error IS NOT NULL
+    """))
+
+    inserted = await connection.scalar(text("""
+        WITH inserted AS (
+            INSERT INTO links (user_id, long_url, long_url_hash, short_url, custom_alias,
+                               created_at, expires_at, views)
+            SELECT :user_id, long_url, long_url_hash, short_url, custom_alias,
+                   coalesce(created_at, now()), expires_at, coalesce(views, 0)
+            FROM links_import s
+            WHERE NOT EXISTS (SELECT 1 FROM import_rejects r WHERE r.row_no = s.row_no)
+            ORDER BY row_no
+            RETURNING id, short_url, custom_alias
+        ), codes AS (
+            INSERT INTO link_codes (code, link_id)
+            SELECT short_url, id FROM inserted
+            UNION ALL
+            SELECT custom_alias, id FROM inserted WHERE custom_alias IS NOT NULL
+        )
+        SELECT count(*) FROM inserted
+    """), {"user_id": user_id})
+    # otherwise nextval would hand the imported sequence codes out again and fail those links with a 409
+    await connection.execute(text(f"""
+        SELECT setval('{SEQUENCE}', greatest(max(s.code_no), (SELECT last_value FROM {SEQUENCE})))
+        FROM links_import s
+        WHERE s.code_no IS NOT NULL AND NOT EXISTS (SELECT 1 FROM import_rejects r WHERE r.row_no = s.row_no)
+        HAVING max(s.code_no) IS NOT NULL
+    """))
+
+    total = await connection.scalar(text("SELECT count(*) FROM links_import"))
+    rejected = await connection.scalar(text("SELECT count(DISTINCT row_no) FROM import_rejects"))
+    sample = (await connection.execute(text(
+        "SELECT row_no, code, reason FROM import_rejects ORDER BY row_no LIMIT :limit"
+    ), {"limit": REJECT_SAMPLE})).all()
+
+    await session.commit()
+
+    return {
+        "rows": total,
+        "inserted": inserted,
+        "rejected": rejected,
+        "conflicts": [{"row": row_no, "code": code, "reason": reason} for row_no, code, reason in sample],
+    }
@@ -0,0 +1,25 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        # a malformed host or port (http://[::1/, http://a:b/, http://x:99999/) still gets a stable digest
+        return url.strip()
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+
+    if port and DEFAULT_PORTS.get(scheme) == port:
+        netloc = netloc.rsplit(":", 1)[0]
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+def url_digest(url: str) -> bytes:
+    return hashlib.blake2b(normalize_url(url).encode(), digest_size=16).digest()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# the app modules live at the repository root and config.py reads the environment on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_path = os.path.join(tempfile.mkdtemp(), "tests.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_path}")
+os.environ.setdefault("SYNC_DATABASE_URL", f"sqlite:///{_path}")
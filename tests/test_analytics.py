@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+
+from shorten.analytics import bucket_end, bucket_start, to_timestamp
+
+
+def test_aware_values_keep_their_offset():
+    moscow = timezone(timedelta(hours=3))
+    assert to_timestamp(datetime(2026, 10, 18, 15, 0, tzinfo=moscow)) == to_timestamp(datetime(2026, 10, 18, 12, 0))
+
+
+def test_naive_values_are_utc():
+    assert to_timestamp(datetime(1970, 1, 1, 1, 0)) == 3600
+
+
+def test_window_end_excludes_the_bucket_starting_at_to():
+    to = to_timestamp(datetime(2026, 10, 18, 12, 0))
+    assert bucket_end(to, "hour") == to
+    assert bucket_end(to + 1, "hour") == to + 3600
+    assert bucket_end(to - 1, "hour") == to
+
+
+def test_window_start_includes_the_bucket_of_from():
+    start = to_timestamp(datetime(2026, 10, 18, 12, 0))
+    assert bucket_start(start, "hour") == start
+    assert bucket_start(start + 59, "minute") == start
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import Base, Link, LinkArchive, LinkCode, LinkCodeArchive, User
+from later.maintenance import ARCHIVE_BATCH
+
+
+# the archive statement is Postgres only, point this at a scratch database it may wipe
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="needs TEST_DATABASE_URL of a scratch Postgres")
+
+
+def expired_link(user_id: int, alias: str) -> Link:
+    link = Link(user_id=user_id, long_url=f"https://example.com/{alias}", short_url=None, custom_alias=alias,
+                expires_at=datetime.now() - timedelta(days=60), views=0)
+    link.codes = [LinkCode(code=alias), LinkCode(code=f"{alias}.short")]
+    return link
+
+
+def test_alias_reused_after_archiving_is_archived_again():
+    async def scenario():
+        engine = create_async_engine(TEST_DATABASE_URL)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        params = {"cutoff": datetime.now() - timedelta(days=30), "limit": 100}
+        try:
+            async with session_maker() as session:
+                session.add(User(id=1, username="archive", email="archive@example.com", hashed_password="x"))
+                await session.commit()
+
+                # the second owner can only take the alias once the first link is archived
+                for _ in range(2):
+                    session.add(expired_link(1, "promo"))
+                    await session.commit()
+
+                    moved, codes = (await session.execute(ARCHIVE_BATCH, params)).one()
+                    await session.commit()
+                    assert moved == 1
+                    assert sorted(codes) == ["promo", "promo.short"]
+
+                assert await session.scalar(select(func.count()).select_from(LinkArchive)) == 2
+                assert await session.scalar(
+                    select(func.count()).select_from(LinkCodeArchive).where(LinkCodeArchive.code == "promo")) == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+import asyncio
+
+import fakeredis
+from fakeredis import aioredis as fake_aioredis
+
+import bloom
+import cache
+from bloom import BLOOM_KEY, BloomFilter, LinkFilter, load_filter, rebuild_filter
+
+
+def fake_redis() -> fake_aioredis.FakeRedis:
+    return fake_aioredis.FakeRedis(server=fakeredis.FakeServer())
+
+
+def test_code_created_on_one_worker_passes_the_filter_of_another(monkeypatch):
+    async def scenario():
+        redis = fake_redis()
+        await redis.set(BLOOM_KEY, BloomFilter.for_capacity(1000).dumps())
+
+        creator, resolver = LinkFilter(), LinkFilter()
+        await load_filter(redis, creator)
+        await load_filter(redis, resolver)
+
+        # created on the first worker, the second one never sees the pub/sub message
+        monkeypatch.setattr(cache, "link_filter", creator)
+        await cache.invalidate_links(redis, "fresh01")
+        assert creator.might_exist("fresh01")
+
+        # a worker started after the code was created
+        restarted = LinkFilter()
+        await load_filter(redis, restarted)
+        assert restarted.might_exist("fresh01")
+
+        # the listener reloads the filter after it reconnects
+        await load_filter(redis, resolver)
+        assert resolver.might_exist("fresh01")
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_keeps_codes_created_during_the_scan(monkeypatch):
+    async def scenario():
+        redis = fake_redis()
+
+        async def build_while_a_code_is_created():
+            # the scan snapshot is taken before the code is committed
+            await cache.invalidate_links(redis, "during01")
+            return BloomFilter.for_capacity(1000)
+
+        monkeypatch.setattr(bloom, "_build_from_db", build_while_a_code_is_created)
+        await rebuild_filter(redis)
+
+        worker = LinkFilter()
+        await load_filter(redis, worker)
+        assert worker.might_exist("during01")
+
+    asyncio.run(scenario())
+
+
+def test_misses_count_as_false_positives_only_behind_a_loaded_filter():
+    link_filter = LinkFilter()
+    link_filter.missed("gone01")
+    assert link_filter.false_positives == 0
+
+    link_filter.bloom = BloomFilter.for_capacity(1000)
+    link_filter.add("gone01")
+    link_filter.missed("gone01")
+    link_filter.missed("never01")
+    assert link_filter.false_positives == 1
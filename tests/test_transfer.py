@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from shorten.codes import SUFFIX, generate_random, shuffler
+from shorten.transfer import STAGING_COLUMNS, _records
+
+
+def parse(*items) -> list[dict]:
+    async def chunks():
+        yield "".join(json.dumps(item) + "\n" for item in items).encode()
+
+    async def collect():
+        return [dict(zip(STAGING_COLUMNS, record)) async for record in _records(chunks(), "ndjson")]
+
+    return asyncio.run(collect())
+
+
+def test_null_long_url_is_a_row_error():
+    first, second = parse({"long_url": None, "short_url": "promo.short"},
+                          {"long_url": "https://example.com/", "short_url": "kept.short"})
+
+    assert first["error"] == "long_url is missing"
+    assert first["long_url_hash"] is None
+    assert second["error"] is None
+    assert second["long_url_hash"] is not None
+
+
+def test_reserved_codes_are_rejected():
+    rows = parse({"long_url": "https://example.com/1", "short_url": "mine"},
+                 {"long_url": "https://example.com/2", "custom_alias": "search"},
+                 {"long_url": "https://example.com/3", "short_url": generate_random()},
+                 {"long_url": "https://example.com/4", "custom_alias": "promo", "short_url": "promo.short"})
+
+    assert [row["error"] for row in rows] == [
+        "short_url is a reserved path",
+        "custom_alias is a reserved path",
+        None,
+        None,
+    ]
+
+
+def test_sequence_codes_carry_their_number():
+    sequence_code = f"{shuffler.encode(42)}{SUFFIX}"
+    rows = parse({"long_url": "https://example.com/1", "short_url": sequence_code},
+                 {"long_url": "https://example.com/2", "short_url": generate_random()},
+                 {"long_url": "https://example.com/3", "short_url": "promo.short"})
+
+    assert [row["error"] for row in rows] == [None, None, None]
+    assert [row["code_no"] for row in rows] == [42, None, None]
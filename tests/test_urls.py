@@ -0,0 +1,14 @@
+import pytest
+
+from shorten.urls import normalize_url, url_digest
+
+
+def test_default_port_and_case_are_normalized():
+    assert normalize_url("HTTP://Example.COM:80") == "http://example.com/"
+    assert url_digest("https://example.com:443/a") == url_digest("https://EXAMPLE.com/a")
+
+
+@pytest.mark.parametrize("url", ["http://a:b/", "http://x:99999/", "http://[::1/"])
+def test_malformed_netloc_still_hashes(url):
+    assert normalize_url(url) == url
+    assert url_digest(f" {url} ") == url_digest(url)
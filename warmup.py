@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import select, tuple_, or_
+
+from cache import CachedLink, cache_ttl, link_cache
+from config import WARMUP_TOP_N, WARMUP_TIME_BUDGET, WARMUP_BATCH
+from database import read_session_maker, Link
+from redis_client import get_redis, REDIS_CACHE_DB
+
+
+logger = logging.getLogger(__name__)
+
+class WarmupState:
+
+    def __init__(self):
+        self.status = "pending"
+        self.target = WARMUP_TOP_N
+        self.loaded = 0
+        self.duration = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "timed_out", "failed", "disabled")
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "loaded": self.loaded,
+            "target": self.target,
+            "duration_seconds": round(self.duration, 3),
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def warm_cache(top_n: int = WARMUP_TOP_N, budget: float = WARMUP_TIME_BUDGET):
+    """Preload the most viewed live links into Redis and the local cache, most popular first."""
+
+    if top_n <= 0:
+        warmup_state.status = "disabled"
+        return
+
+    warmup_state.status = "running"
+    started = time.perf_counter()
+    deadline = started + budget
+    redis_cache = get_redis(REDIS_CACHE_DB)
+    now = datetime.now()
+    last = None
+
+    try:
+        async with read_session_maker() as session:
+            while warmup_state.loaded < top_n:
+                if time.perf_counter() > deadline:
+                    warmup_state.status = "timed_out"
+                    break
+
+                query = (
+                    select(Link.id, Link.views, Link.short_url, Link.custom_alias, Link.long_url, Link.expires_at,
+                           Link.exact_clicks)
+                    .where(Link.short_url.isnot(None),
+                           Link.short_url != "",
+                           or_(Link.expires_at.is_(None), Link.expires_at > now))
+                    .order_by(Link.views.desc(), Link.id.desc())
+                    .limit(min(WARMUP_BATCH, top_n - warmup_state.loaded))
+                )
+                if last:
+                    query = query.where(tuple_(Link.views, Link.id) < last)
+
+                rows = (await session.execute(query)).all()
+                if not rows:
+                    break
+
+                async with redis_cache.pipeline(transaction=False) as pipe:
+                    for link_id, _, short_url, alias, long_url, expires_at, exact_clicks in rows:
+                        cached = CachedLink(link_id, long_url, expires_at, exact_clicks)
+                        for code in filter(None, (short_url, alias)):
+                            link_cache.set(code, cached)
+                            pipe.setex(f"cache:{code}", cache_ttl(expires_at, now), cached.dumps())
+                    await pipe.execute()
+
+                warmup_state.loaded += len(rows)
+                last = (rows[-1].views, rows[-1].id)
+
+        if warmup_state.status == "running":
+            warmup_state.status = "done"
+
+    except Exception as e:
+        warmup_state.status = "failed"
+        logger.error(f"Cache warm-up failed: {str(e)}")
+
+    finally:
+        warmup_state.duration = time.perf_counter() - started
+        logger.info(f"Cache warm-up {warmup_state.status}: {warmup_state.loaded} links "
+                    f"in {warmup_state.duration:.3f}s")